@@ -0,0 +1,88 @@
+import asyncio
+import weakref
+
+from adam_genius import ADaMMetadataRetriever
+
+
+class AsyncADaMMetadataRetriever:
+    """
+    asyncio interface to ADaMMetadataRetriever for serving many concurrent lookups.
+
+    Wraps one synchronous retriever, so every caller shares its pooled HTTP session,
+    response cache, ADaMIG indexes and CT packages. Blocking work runs on the
+    retriever's bounded worker pool (not a thread per caller), and concurrent
+    awaits for the same resource share a single task.
+    """
+
+    def __init__(self, retriever=None, **retriever_kwargs):
+        """Wrap an existing retriever, or create one from ADaMMetadataRetriever keyword arguments."""
+        self.retriever = retriever or ADaMMetadataRetriever(**retriever_kwargs)
+        # Event loop -> {key: task in flight}; tasks belong to the loop that created them
+        self._in_flight = weakref.WeakKeyDictionary()
+
+    async def _run(self, fn, *args):
+        """Run a blocking retriever call on the retriever's worker pool."""
+        return await asyncio.get_running_loop().run_in_executor(self.retriever._executor, fn, *args)
+
+    async def _coalesced(self, key, fn, *args):
+        """Await fn(*args) on the worker pool, sharing one task among concurrent callers with the same key."""
+        loop = asyncio.get_running_loop()
+        pending = self._in_flight.setdefault(loop, {})
+        task = pending.get(key)
+        if task is None:
+            task = loop.create_task(self._run(fn, *args))
+            pending[key] = task
+            task.add_done_callback(lambda _: pending.pop(key, None))
+        # Shield so one caller being cancelled does not cancel the others' shared task
+        return await asyncio.shield(task)
+
+    async def get_latest_ct_version_for_standard(self, standard):
+        """Retrieve the latest Controlled Terminology version for a given standard (e.g., adamct, sdtmct)."""
+        return await self._coalesced(("ct_version", standard), self.retriever.get_latest_ct_version_for_standard, standard)
+
+    async def get_codelist_terms(self, codelist_code, standard, ct_version):
+        """Fetch terms for a specific codelist code from the specified CT package (standard and version)."""
+        cl_info = await self._coalesced(("codelist", codelist_code.upper(), standard, ct_version),
+                                        self.retriever.get_codelist_terms, codelist_code, standard, ct_version)
+        if cl_info is None:
+            return None
+        # Coalesced callers each get their own copy, as with the synchronous retriever
+        return {**cl_info, "Terms": list(cl_info["Terms"])}
+
+    async def get_variable_details(self, adam_variable, adamig_version, ct_versions=None):
+        """
+        Fetch details for a specific ADaM variable.
+
+        Codelists are fetched concurrently; ct_versions works as in
+        ADaMMetadataRetriever.get_variable_details.
+        """
+        if not adamig_version:
+            raise ValueError("ADaMIG version is required.")
+        adamig_version_hyphen = adamig_version.replace(".", "-")
+
+        details = await self._coalesced(("variable", adam_variable.upper(), adamig_version_hyphen),
+                                        self.retriever.get_variable_details,
+                                        adam_variable, adamig_version_hyphen, None, False)
+        if not details:
+            return None
+        details = {**details, "CodelistLinks": list(details["CodelistLinks"]), "Codelists": []}
+
+        unique_codelists = self.retriever.codelist_references(details)
+        if not unique_codelists:
+            return details
+
+        # Resolve each referenced standard's latest CT version, then fetch every codelist at once
+        ct_versions = ct_versions if ct_versions is not None else {}
+        standards = sorted({standard for cl_id, standard, href in unique_codelists} - set(ct_versions))
+        for standard, ct_version in zip(standards, await asyncio.gather(
+                *(self.get_latest_ct_version_for_standard(standard) for standard in standards))):
+            ct_versions[standard] = ct_version
+
+        fetches = []
+        for cl_id, standard, href in unique_codelists:
+            if ct_versions.get(standard):
+                fetches.append(self.get_codelist_terms(cl_id, standard, ct_versions[standard]))
+            else:
+                print(f"Warning: Could not fetch latest {standard} version, skipping codelist {cl_id}.")
+        details["Codelists"] = [codelist for codelist in await asyncio.gather(*fetches) if codelist]
+        return details
@@ -0,0 +1,261 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """
+    Persistent SQLite cache of CDISC Library API response bodies, keyed by URL.
+
+    Files derived from responses (converted CT packages) live next to the database
+    and share its size budget.
+    """
+
+    # Default location, overridable with ADAM_GENIUS_CACHE_DIR or --cache-dir
+    DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "adam_genius")
+    DEFAULT_MAX_BYTES = 1024 * 1024 * 1024 # 1 GB of compressed bodies
+    DEFAULT_TTL = 24 * 60 * 60 # Seconds before a mutable endpoint is revalidated
+
+    # Versioned releases never change once published, so they are never revalidated.
+    # e.g., /mdr/adam/adamig-1-3, /mdr/adam/adamig-1-3/datastructures/ADSL/variables/AGE,
+    #       /mdr/ct/packages/sdtmct-2024-03-29
+    IMMUTABLE_URL_PATTERNS = [
+        re.compile(r"/mdr/adam/adamig-\d+-\d+(/|$)"),
+        re.compile(r"/mdr/ct/packages/[a-z]+-\d{4}-\d{2}-\d{2}(/|$)"),
+    ]
+
+    # Files derived from responses (converted CT packages) share max_bytes with the cached
+    # responses and are evicted with them; a file's modification time records its last use
+    FILES_DIR = "ct"
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES, ttl=DEFAULT_TTL):
+        """Open (or create) the cache database in cache_dir."""
+        self.cache_dir = cache_dir or os.getenv('ADAM_GENIUS_CACHE_DIR') or self.DEFAULT_CACHE_DIR
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.path = os.path.join(self.cache_dir, "responses.sqlite3")
+
+        # One connection shared between threads, serialized by a lock.
+        # WAL lets the CLI and the Streamlit server use the same cache file concurrently.
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS responses (
+                       url TEXT PRIMARY KEY,
+                       body BLOB NOT NULL,
+                       size INTEGER NOT NULL,
+                       etag TEXT,
+                       last_modified TEXT,
+                       fetched_at REAL NOT NULL,
+                       accessed_at REAL NOT NULL
+                   )"""
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed_at)")
+
+    def is_immutable(self, url):
+        """Return True if the URL points to a versioned release that never changes."""
+        return any(pattern.search(url) for pattern in self.IMMUTABLE_URL_PATTERNS)
+
+    def get(self, url):
+        """
+        Look up a cached response.
+
+        Returns a dict with the raw body, its validators (etag, last_modified) and
+        whether it is still fresh, or None if the URL has never been cached.
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT body, etag, last_modified, fetched_at FROM responses WHERE url = ?", (url,)
+            ).fetchone()
+            if row is None:
+                return None
+            # Record the access for LRU eviction
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE url = ?", (now, url))
+
+        body, etag, last_modified, fetched_at = row
+        return {
+            "body": zlib.decompress(body),
+            "etag": etag,
+            "last_modified": last_modified,
+            "fresh": self.is_immutable(url) or (now - fetched_at) < self.ttl,
+        }
+
+    def put(self, url, body, etag=None, last_modified=None):
+        """Store a raw response body (bytes) and its validators, then evict if over budget."""
+        compressed = zlib.compress(body, 1) # Fast level; CT JSON still shrinks ~10x
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                """INSERT OR REPLACE INTO responses (url, body, size, etag, last_modified, fetched_at, accessed_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (url, compressed, len(compressed), etag, last_modified, now, now)
+            )
+            self._evict()
+
+    def touch(self, url):
+        """Mark a cached entry as freshly validated (after a 304 Not Modified)."""
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "UPDATE responses SET fetched_at = ?, accessed_at = ? WHERE url = ?", (now, now, url)
+            )
+
+    def file_path(self, name):
+        """Location for a derived file; register it with add_file once written."""
+        return os.path.join(self.cache_dir, self.FILES_DIR, name)
+
+    def touch_file(self, path):
+        """Mark a derived file as used for LRU eviction."""
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+
+    def add_file(self, path):
+        """Count a newly written derived file against max_bytes, evicting others if over budget."""
+        self.touch_file(path)
+        with self._lock, self._conn:
+            self._evict(keep=path)
+
+    def _derived_files(self):
+        """(last used, size, path) of every derived file, skipping ones still being written."""
+        files = []
+        try:
+            entries = list(os.scandir(os.path.join(self.cache_dir, self.FILES_DIR)))
+        except OSError:
+            return files
+        for entry in entries:
+            if entry.name.endswith(".tmp") or not entry.is_file():
+                continue
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue # Removed concurrently
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+        return files
+
+    def _evict(self, keep=None):
+        """
+        Drop least recently used responses and derived files until the cache fits in
+        max_bytes, never removing keep. Caller holds the lock.
+        """
+        files = self._derived_files()
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        total += sum(size for accessed_at, size, path in files)
+        if total <= self.max_bytes:
+            return
+        rows = self._conn.execute("SELECT accessed_at, size, url FROM responses").fetchall()
+        candidates = [(accessed_at, size, url, None) for accessed_at, size, url in rows]
+        candidates += [(accessed_at, size, None, path) for accessed_at, size, path in files if path != keep]
+        for accessed_at, size, url, path in sorted(candidates, key=lambda candidate: candidate[0]):
+            if total <= self.max_bytes:
+                break
+            if path:
+                try:
+                    os.remove(path) # An open (memory-mapped) package stays readable
+                except OSError:
+                    continue
+            else:
+                self._conn.execute("DELETE FROM responses WHERE url = ?", (url,))
+            total -= size
+
+    def clear(self):
+        """Remove every cached response."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM responses")
+
+
+class AnswerCache:
+    """
+    Thread-safe in-memory LRU cache of LLM answers with a time-to-live.
+
+    Entries are keyed on (variable, normalized query, metadata hash, model). The
+    metadata hash covers the ADaMIG and CT versions in the prompt, so answers are
+    invalidated automatically when new releases are used.
+    """
+
+    DEFAULT_MAX_ENTRIES = 1024
+    DEFAULT_TTL = 24 * 60 * 60
+
+    # Words a near-duplicate wording may add or drop; any other differing word (label/core,
+    # required/permitted, "not") can change the answer, so it never matches
+    IGNORABLE_WORDS = frozenset({
+        "a", "an", "the", "please", "tell", "me", "can", "could", "you", "i", "want", "to", "know",
+        "what", "is", "s", "whats", "about", "of", "for", "in", "variable", "adam",
+    })
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL, near_duplicate_threshold=None):
+        """
+        Queries match on their exact normalized wording by default. near_duplicate_threshold,
+        if set (e.g., 0.8), also serves a cached answer for a wording of the question for the
+        same variable, metadata and model whose word set overlaps at least that much (Jaccard
+        similarity) and differs only in IGNORABLE_WORDS, e.g., "What is ABLFL?" and
+        "Tell me about the ABLFL variable".
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.near_duplicate_threshold = near_duplicate_threshold
+        self._entries = OrderedDict() # key -> (answer, stored_at, query words)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize_query(query):
+        """Lower-case, drop punctuation and collapse whitespace."""
+        return " ".join(re.findall(r"[a-z0-9]+", query.lower()))
+
+    def _key(self, variable, query, metadata, model):
+        metadata_hash = hashlib.sha256((metadata or "").encode("utf-8")).hexdigest()
+        return ((variable or "").upper(), self.normalize_query(query), metadata_hash, model)
+
+    def get(self, variable, query, metadata, model):
+        """Return the cached answer, or None."""
+        key = self._key(variable, query, metadata, model)
+        with self._lock:
+            if key not in self._entries and self.near_duplicate_threshold:
+                key = self._find_near_duplicate(key)
+            if key not in self._entries:
+                return None
+            answer, stored_at, words = self._entries[key]
+            if time.time() - stored_at >= self.ttl:
+                del self._entries[key] # Expired
+                return None
+            self._entries.move_to_end(key)
+            return answer
+
+    def _find_near_duplicate(self, key):
+        """Closest cached wording of the same question, or the key itself. Caller holds the lock."""
+        words = set(key[1].split())
+        best_key, best_score = key, self.near_duplicate_threshold
+        for other_key, (answer, stored_at, other_words) in self._entries.items():
+            if (other_key[0], other_key[2], other_key[3]) != (key[0], key[2], key[3]):
+                continue
+            if time.time() - stored_at >= self.ttl:
+                continue
+            if (words ^ other_words) - self.IGNORABLE_WORDS:
+                continue # Differs in a word that may decide the answer
+            score = len(words & other_words) / max(1, len(words | other_words))
+            if score >= best_score:
+                best_key, best_score = other_key, score
+        return best_key
+
+    def put(self, variable, query, metadata, model, answer):
+        """Store an answer, evicting the least recently used entry when full."""
+        key = self._key(variable, query, metadata, model)
+        with self._lock:
+            self._entries[key] = (answer, time.time(), set(key[1].split()))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
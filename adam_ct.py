@@ -0,0 +1,258 @@
+import io
+import json
+import mmap
+import os
+import struct
+
+import ijson
+
+
+class CTPackage:
+    """
+    Controlled Terminology package in a compact, memory-mappable layout.
+
+    A package is converted once from the CDISC Library JSON into a single buffer:
+
+        header   magic, index offset, index length
+        blobs    one compact JSON blob per codelist (processed, terms pre-sorted)
+        index    JSON table of codelists: C-code, submission value, name,
+                 extensibility, term count and the blob's offset and length
+
+    Opening a package only decodes the small index; a codelist's terms are
+    decoded when it is requested. Backed by an mmap, many CT versions can stay
+    open with little resident memory.
+    """
+
+    MAGIC = b"ADGCTP02" # Bumped whenever the serialized layout or processed fields change
+    HEADER = struct.Struct("<8sQQ") # magic, index offset, index length
+    FILE_EXTENSION = ".ctp"
+
+    # Columns of each row in the index table
+    CODE, SUBMISSION_VALUE, NAME, EXTENSIBLE, TERM_COUNT, OFFSET, LENGTH = range(7)
+
+    def __init__(self, buffer, source=None):
+        """Wrap a buffer produced by to_bytes (bytes or an mmap)."""
+        if len(buffer) < self.HEADER.size:
+            raise ValueError(f"{source or 'Buffer'} is not a CT package file.")
+        magic, index_offset, index_length = self.HEADER.unpack_from(buffer, 0)
+        if magic != self.MAGIC or index_offset + index_length > len(buffer):
+            raise ValueError(f"{source or 'Buffer'} is not a CT package file.")
+        self._buffer = buffer
+        self.source = source
+
+        index = json.loads(bytes(buffer[index_offset:index_offset + index_length]))
+        self.standard = index["standard"]
+        self.ct_version = index["version"]
+        self._rows = index["codelists"]
+        self.by_code = {} # C-code -> index row
+        self.by_submission_value = {} # Submission value (e.g., NY) -> index row
+        for row in self._rows:
+            # Keep the first match for each key, as the original linear scans did
+            if row[self.CODE]:
+                self.by_code.setdefault(row[self.CODE].upper(), row)
+            if row[self.SUBMISSION_VALUE]:
+                self.by_submission_value.setdefault(row[self.SUBMISSION_VALUE].upper(), row)
+
+    @classmethod
+    def from_json(cls, standard, ct_version, data):
+        """Build an in-memory package from a /mdr/ct/packages/{standard}-{version} document."""
+        return cls(cls.to_bytes(standard, ct_version, data))
+
+    @classmethod
+    def open(cls, path):
+        """Memory-map a package file written by write."""
+        with open(path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls(buffer, source=path)
+
+    @classmethod
+    def write(cls, path, standard, ct_version, data):
+        """Convert a CT package document and write it to path atomically."""
+        cls._write_atomic(path, standard, ct_version, data.get("codelists", []))
+
+    @classmethod
+    def write_from_file(cls, path, standard, ct_version, fileobj):
+        """
+        Convert a CT package document read from a binary file object (e.g., an HTTP
+        response stream) and write it to path atomically.
+
+        The document is parsed one codelist at a time, so the full object tree of a
+        multi-megabyte package is never built in memory.
+        """
+        cls._write_atomic(path, standard, ct_version, cls.iter_json_codelists(fileobj))
+
+    @staticmethod
+    def iter_json_codelists(fileobj):
+        """Yield the raw codelists of a CT package document, one at a time."""
+        try:
+            yield from ijson.items(fileobj, "codelists.item", use_float=True)
+        except ijson.JSONError as e:
+            raise ValueError(f"Invalid CT package document: {e}") from e
+
+    @classmethod
+    def _write_atomic(cls, path, standard, ct_version, codelists):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                cls._serialize(f, standard, ct_version, codelists)
+            os.replace(tmp_path, path) # Readers never see a partial file
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    @classmethod
+    def to_bytes(cls, standard, ct_version, data):
+        """Serialize a CT package document into the compact layout."""
+        buffer = io.BytesIO()
+        cls._serialize(buffer, standard, ct_version, data.get("codelists", []))
+        return buffer.getvalue()
+
+    @classmethod
+    def _serialize(cls, f, standard, ct_version, codelists):
+        """Write the compact layout to a seekable binary file, one codelist at a time."""
+        f.write(cls.HEADER.pack(cls.MAGIC, 0, 0)) # Rewritten once the index position is known
+        rows = []
+        offset = cls.HEADER.size
+        for codelist in codelists:
+            cl_info = cls._process_codelist(codelist, standard, ct_version)
+            blob = json.dumps(cl_info, separators=(",", ":")).encode("utf-8")
+            rows.append([
+                cl_info["CodelistCode"],
+                cl_info["ID"],
+                cl_info["Name"],
+                cl_info["ExtensibleYN"] == "Yes",
+                len(cl_info["Terms"]),
+                offset,
+                len(blob),
+            ])
+            f.write(blob)
+            offset += len(blob)
+
+        index = json.dumps({"standard": standard, "version": ct_version, "codelists": rows},
+                           separators=(",", ":")).encode("utf-8")
+        f.write(index)
+        f.seek(0)
+        f.write(cls.HEADER.pack(cls.MAGIC, offset, len(index)))
+
+    @staticmethod
+    def _process_codelist(codelist, standard, ct_version):
+        """Process a raw codelist (similar to cdisc_codelist.py) with terms sorted by submission value."""
+        extensible = codelist.get("extensible", False)
+        if isinstance(extensible, str):
+            extensible = extensible.lower() == "true" # "true"/"false" strings, not JSON booleans
+        cl_info = {
+            "ID": codelist.get("submissionValue", ""),
+            "CodelistCode": codelist.get("conceptId", ""),
+            "Name": codelist.get("name", ""),
+            "ExtensibleYN": "Yes" if extensible else "No",
+            "Standard": standard, # Add standard info
+            "Version": ct_version, # Add version info
+            "Terms": []
+        }
+
+        for term in codelist.get("terms", []):
+            cl_info["Terms"].append({
+                "TermCode": term.get("conceptId", ""),
+                "TERM": term.get("submissionValue", ""),
+                "TermDecodedValue": term.get("preferredTerm", "")
+            })
+
+        # Sort terms by submission value
+        cl_info["Terms"].sort(key=lambda x: x.get("TERM", ""))
+        return cl_info
+
+    def __len__(self):
+        return len(self._rows)
+
+    def find_codelist(self, codelist_code):
+        """Return the index row for a C-code, falling back to its submission value, or None."""
+        key = codelist_code.upper()
+        row = self.by_code.get(key)
+        if row is None:
+            # Also check submissionValue as a fallback, though conceptId is preferred
+            row = self.by_submission_value.get(key)
+            if row is not None:
+                print(f"Note: Matched codelist {codelist_code} using submissionValue.")
+        return row
+
+    def _blob(self, row):
+        offset, length = row[self.OFFSET], row[self.LENGTH]
+        return bytes(self._buffer[offset:offset + length])
+
+    def _decode(self, row):
+        return json.loads(self._blob(row))
+
+    def get_codelist(self, codelist_code):
+        """Return the processed codelist (ID, name, extensibility and sorted terms), or None."""
+        row = self.find_codelist(codelist_code)
+        if row is None:
+            return None
+        return self._decode(row)
+
+    def codelist_codes(self):
+        """C-codes of every codelist in the package, in package order."""
+        return [row[self.CODE] for row in self._rows]
+
+    def iter_codelists(self):
+        """Yield every processed codelist, decoding one at a time."""
+        for row in self._rows:
+            yield self._decode(row)
+
+    def diff(self, other, codelist_codes=None):
+        """
+        Compare this package with a newer one, joining codelists and terms on their C-codes.
+
+        Returns a list of change records with Change (added, removed or changed), Level
+        (codelist or term), CodelistCode, CodelistID, TermCode, TERM, Field, Old and New.
+        codelist_codes, if given, restricts the comparison to those codelists.
+        """
+        codes = {code.upper() for code in codelist_codes} if codelist_codes is not None else None
+        changes = []
+
+        def record(change, level, row, term=None, field="", old="", new=""):
+            changes.append({
+                "Change": change, "Level": level,
+                "CodelistCode": row[self.CODE], "CodelistID": row[self.SUBMISSION_VALUE],
+                "TermCode": term.get("TermCode", "") if term else "", "TERM": term.get("TERM", "") if term else "",
+                "Field": field, "Old": old, "New": new,
+            })
+
+        # Unchanged codelists are skipped by comparing their blobs, which differ only in the version
+        old_version = f'"Version":{json.dumps(self.ct_version)}'.encode("utf-8")
+        new_version = f'"Version":{json.dumps(other.ct_version)}'.encode("utf-8")
+
+        for code, row in self.by_code.items():
+            if codes is not None and code not in codes:
+                continue
+            new_row = other.by_code.get(code)
+            if new_row is None:
+                record("removed", "codelist", row, old=row[self.NAME])
+                continue
+            for field, column in (("ID", self.SUBMISSION_VALUE), ("Name", self.NAME), ("ExtensibleYN", self.EXTENSIBLE)):
+                if row[column] != new_row[column]:
+                    old, new = row[column], new_row[column]
+                    if column == self.EXTENSIBLE:
+                        old, new = ("Yes" if old else "No"), ("Yes" if new else "No")
+                    record("changed", "codelist", new_row, field=field, old=old, new=new)
+            if self._blob(row).replace(old_version, new_version) == other._blob(new_row):
+                continue
+
+            old_terms = {term["TermCode"] or term["TERM"]: term for term in self._decode(row)["Terms"]}
+            new_terms = {term["TermCode"] or term["TERM"]: term for term in other._decode(new_row)["Terms"]}
+            for key, term in old_terms.items():
+                new_term = new_terms.get(key)
+                if new_term is None:
+                    record("removed", "term", new_row, term)
+                    continue
+                for field in ("TERM", "TermDecodedValue"):
+                    if term.get(field) != new_term.get(field):
+                        record("changed", "term", new_row, new_term, field=field, old=term.get(field), new=new_term.get(field))
+            for key, term in new_terms.items():
+                if key not in old_terms:
+                    record("added", "term", new_row, term)
+
+        for code, row in other.by_code.items():
+            if code not in self.by_code and (codes is None or code in codes):
+                record("added", "codelist", row, new=row[self.NAME])
+        return changes
@@ -2,26 +2,242 @@ import os
 import sys
 import json
 import argparse
+import atexit
 import requests
+import urllib3
 import csv
+import difflib
+import re
+import threading
+from collections import deque
+from contextlib import redirect_stdout
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 
+from adam_cache import ResponseCache
+from adam_ct import CTPackage
+from adam_http import InFlightRequests, TokenBucket, create_session, get_with_retries
+from adam_snapshot import Snapshot
+from adam_trace import tracer
+
 # Uncomment and use python-dotenv to load environment variables
 from dotenv import load_dotenv
 load_dotenv()
 
+class ADaMIGVariableIndex:
+    """Index of every variable in one ADaMIG version, keyed by upper-cased variable name."""
+
+    # Fields get_variable_details reports; if the IG document carries them all,
+    # the per-variable endpoint does not need to be called.
+    DETAIL_FIELDS = ("name", "label", "simpleDatatype", "core", "description", "_links")
+
+    # Words ignored when matching query text against variable labels
+    LABEL_STOPWORDS = {"a", "an", "and", "at", "by", "for", "in", "is", "of", "on", "or", "per", "the", "to", "with"}
+    # Fraction of a label's words a query must contain for the label to count as a match
+    LABEL_MATCH_THRESHOLD = 0.75
+
+    def __init__(self, adamig_version, data):
+        """Build the index from a /mdr/adam/adamig-{version} document."""
+        self.adamig_version = adamig_version
+        self.variables = {} # NAME -> [{"Dataset", "VariableSet", "Variable"}, ...] in IG order
+        self.datasets = {} # Data structure name -> its entries in IG order
+
+        for ds in data.get("dataStructures", []):
+            ds_name = ds.get("name")
+            if not ds_name:
+                continue # Skip structures without a name
+
+            # Variables directly within the data structure (less common but possible)
+            for var in ds.get("analysisVariables", []):
+                self._add(ds_name, None, var)
+
+            # Variables within analysisVariableSets (more common)
+            for var_set in ds.get("analysisVariableSets", []):
+                for var in var_set.get("analysisVariables", []):
+                    self._add(ds_name, var_set.get("name"), var)
+
+        # Whether the document embeds codelist links at all; only then does an entry
+        # without one mean the variable has no codelist
+        self.embeds_codelist_links = any("codelist" in (entries[0]["Variable"].get("_links") or {})
+                                         for entries in self.variables.values())
+
+        # Names with lower-case placeholders (e.g., TRTxxP, ANLzzFL) stand for numbered
+        # variables (TRT01P, ANL01FL); each placeholder letter matches one digit
+        self._placeholder_patterns = []
+        # Label word -> variable names, and the number of distinct words in each label
+        self._label_words = {}
+        self._label_sizes = {}
+        for name, entries in self.variables.items():
+            original_name = entries[0]["Variable"].get("name", name)
+            if original_name != original_name.upper():
+                pattern = re.compile("^" + re.sub(r"[a-z]", r"\\d", original_name) + "$")
+                self._placeholder_patterns.append((pattern, name))
+            words = self._label_word_set(entries[0]["Variable"].get("label") or "")
+            for word in words:
+                self._label_words.setdefault(word, set()).add(name)
+            self._label_sizes[name] = len(words)
+
+    def _add(self, ds_name, var_set_name, var):
+        name = var.get("name", "").upper()
+        if name:
+            entry = {
+                "Dataset": ds_name,
+                "VariableSet": var_set_name,
+                "Variable": var
+            }
+            self.variables.setdefault(name, []).append(entry)
+            self.datasets.setdefault(ds_name, []).append(entry)
+
+    def lookup(self, adam_variable):
+        """
+        Return every (dataset, variable set, payload) entry for a variable name, or an empty list.
+
+        Numbered names resolve to their placeholder form (TRT01P -> TRTxxP).
+        """
+        key = adam_variable.upper()
+        if key in self.variables:
+            return self.variables[key]
+        for pattern, name in self._placeholder_patterns:
+            if pattern.match(key):
+                return self.variables[name]
+        return []
+
+    @classmethod
+    def _label_word_set(cls, text):
+        return {word for word in re.findall(r"[a-z0-9]+", text.lower()) if word not in cls.LABEL_STOPWORDS}
+
+    def match_query(self, query):
+        """
+        Find the variable(s) a natural-language query is about, without an LLM.
+
+        Variable names written in the query win (names typed in upper case take
+        precedence over other case-insensitive hits); otherwise the variables whose
+        labels best match the query words are returned. An empty list means no match
+        and more than one name means the query is ambiguous.
+        """
+        strong, weak = [], []
+        for token in re.findall(r"[A-Za-z][A-Za-z0-9]*", query):
+            if self.lookup(token):
+                matches = strong if token.isupper() else weak
+                if token.upper() not in matches:
+                    matches.append(token.upper())
+        if strong or weak:
+            return strong or weak
+        return self.match_label(query)
+
+    def match_label(self, query):
+        """Return the variables whose labels best cover the query words (typo-tolerant), or an empty list."""
+        vocabulary = list(self._label_words)
+        matched_words = set()
+        for word in self._label_word_set(query):
+            if word in self._label_words:
+                matched_words.add(word)
+            else:
+                matched_words.update(difflib.get_close_matches(word, vocabulary, n=1, cutoff=0.85))
+
+        counts = {}
+        for word in matched_words:
+            for name in self._label_words[word]:
+                counts[name] = counts.get(name, 0) + 1
+        if not counts:
+            return []
+
+        # Rank by the share of the label the query covers, then by words matched
+        ranked = sorted(((count / self._label_sizes[name], count, name) for name, count in counts.items()), reverse=True)
+        best_coverage, best_count = ranked[0][0], ranked[0][1]
+        if best_coverage < self.LABEL_MATCH_THRESHOLD:
+            return []
+        return sorted(name for coverage, count, name in ranked if (coverage, count) == (best_coverage, best_count))
+
+    # Variable payload fields compared by diff, with the names reported for them
+    DIFF_FIELDS = (("label", "Label"), ("simpleDatatype", "DataType"), ("core", "Core"), ("description", "CDISCNotes"))
+
+    def diff(self, other, variables=None):
+        """
+        Compare this ADaMIG version with a newer one, joining variables on (data structure, name).
+
+        Returns a list of change records with Change (added, removed or changed), Dataset,
+        Variable, Field, Old and New. variables, if given, restricts the comparison to those names;
+        numbered names select their placeholder entry (TRT01P -> TRTxxP) in either version.
+        """
+        names = None
+        if variables is not None:
+            names = set()
+            for name in variables:
+                for index in (self, other):
+                    entries = index.lookup(name)
+                    names.add(entries[0]["Variable"].get("name", name).upper() if entries else name.upper())
+
+        def keyed(index):
+            return {(entry["Dataset"], name): entry["Variable"]
+                    for name, entries in index.variables.items()
+                    if names is None or name in names
+                    for entry in entries}
+
+        def codelists(var):
+            return ", ".join(sorted(link.get("href", "").split("/")[-1]
+                                    for link in var.get("_links", {}).get("codelist", [])))
+
+        old_vars, new_vars = keyed(self), keyed(other)
+        changes = []
+        for (dataset, name), var in old_vars.items():
+            new_var = new_vars.get((dataset, name))
+            if new_var is None:
+                changes.append({"Change": "removed", "Dataset": dataset, "Variable": var.get("name", name),
+                                "Field": "", "Old": var.get("label", ""), "New": ""})
+                continue
+            fields = [(label, var.get(field), new_var.get(field)) for field, label in self.DIFF_FIELDS
+                      if field in var and field in new_var]
+            if "_links" in var and "_links" in new_var:
+                fields.append(("Codelists", codelists(var), codelists(new_var)))
+            for label, old, new in fields:
+                if old != new:
+                    changes.append({"Change": "changed", "Dataset": dataset, "Variable": new_var.get("name", name),
+                                    "Field": label, "Old": old, "New": new})
+        for (dataset, name), var in new_vars.items():
+            if (dataset, name) not in old_vars:
+                changes.append({"Change": "added", "Dataset": dataset, "Variable": var.get("name", name),
+                                "Field": "", "Old": "", "New": var.get("label", "")})
+        return changes
+
+    def has_details(self, var):
+        """Check whether an embedded variable payload carries every field we report, codelist links included."""
+        if not all(field in var for field in self.DETAIL_FIELDS) or not isinstance(var["_links"], dict):
+            return False
+        return "codelist" in var["_links"] or self.embeds_codelist_links
+
+# CT standards ADaM variables draw their codelists from
+DEFAULT_CT_STANDARDS = ("adamct", "sdtmct")
+
 class ADaMMetadataRetriever:
     """Class for retrieving ADaM variable metadata from the CDISC Library API."""
 
     # Base URL for the CDISC Library API
     BASE_URL = "https://library.cdisc.org/api"
 
-    def __init__(self, api_key=None):
-        """Initialize the retriever with an API key from environment or parameter."""
+    # Concurrency defaults: parallel fetches per retriever and API requests per second
+    DEFAULT_MAX_WORKERS = 8
+    DEFAULT_RATE_LIMIT = 10.0
+    # Retries for 429/5xx and connection errors; (connect, read) timeout in seconds
+    DEFAULT_MAX_RETRIES = 4
+    REQUEST_TIMEOUT = (10, 300)
+
+    def __init__(self, api_key=None, cache_dir=None, use_cache=True,
+                 max_workers=DEFAULT_MAX_WORKERS, rate_limit=DEFAULT_RATE_LIMIT,
+                 max_retries=DEFAULT_MAX_RETRIES, offline=None):
+        """
+        Initialize the retriever with an API key from environment or parameter.
+
+        offline, if given, is the path of a snapshot archive (see export_snapshot);
+        every request is then served from it and no API key or network is needed.
+        """
         # Prioritize parameter, then environment variable
         self.api_key = api_key or os.getenv('CDISC_API_KEY')
+        # Alternate API endpoint, e.g., a proxy or the benchmark mock server
+        self.BASE_URL = os.getenv('CDISC_API_BASE_URL', self.BASE_URL).rstrip('/')
+        self.snapshot = Snapshot(offline) if offline else None
         
-        if not self.api_key:
+        if not self.api_key and not self.snapshot:
             raise ValueError("CDISC API key is required. Set CDISC_API_KEY in .env file or pass as parameter.")
         
         self.headers = {
@@ -29,68 +245,208 @@ class ADaMMetadataRetriever:
             "Accept": "application/json"
         }
 
-    def _make_request(self, url):
-        """Helper function to make API requests."""
+        # Persistent response cache; versioned ADaMIG/CT releases are immutable
+        self.cache = ResponseCache(cache_dir) if use_cache and not self.snapshot else None
+        # ADaMIG version -> ADaMIGVariableIndex, built once per retriever
+        self._variable_indexes = {}
+        # (standard, CT version) -> CTPackage (memory-mapped when cached), shared by every codelist lookup
+        self._ct_packages = {}
+        # Standard -> CT version served as "latest" without consulting the API (see refresh_latest_ct_versions)
+        self._pinned_ct_versions = {}
+        # (standard, CT version) pins replaced by a newer release; their packages are not kept in _ct_packages
+        self._superseded_ct_versions = set()
+        # Per-key locks so concurrent callers build each memoized entry only once
+        self._memo_lock = threading.Lock()
+        self._key_locks = {}
+
+        # Pooled keep-alive session, bounded worker pool for independent fetches,
+        # and a token bucket to stay within the CDISC Library rate limits
+        self.max_workers = max_workers
+        self.session = create_session(pool_size=max_workers)
+        self.rate_limiter = TokenBucket(rate_limit)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="adam-genius")
+        self.max_retries = max_retries
+        # Concurrent requests for the same URL (e.g., one CT package) share a single fetch
+        self._in_flight = InFlightRequests()
+
+    def _memoized(self, memo, key, build, store_none=False):
+        """Return memo[key], calling build() at most once per key even across threads."""
+        if key in memo:
+            return memo[key]
+        lock_key = (id(memo), key)
+        with self._memo_lock:
+            key_lock = self._key_locks.setdefault(lock_key, threading.Lock())
+        with key_lock:
+            if key in memo:
+                return memo[key] # Built by another thread while we waited
+            try:
+                value = build()
+                if value is not None or store_none:
+                    memo[key] = value
+                return value
+            finally:
+                # Later callers find the memoized value; drop the lock so the table stays small
+                with self._memo_lock:
+                    if self._key_locks.get(lock_key) is key_lock:
+                        del self._key_locks[lock_key]
+
+    @tracer.traced("api.request")
+    def _make_request(self, url, revalidate=False):
+        """
+        Helper function to make API requests, served from the response cache when possible.
+
+        revalidate=True checks a cached mutable endpoint with the API even while it is fresh.
+        """
+        api_path = url[len(self.BASE_URL):] if url.startswith(self.BASE_URL) else url
+        span = tracer.current()
+        span["path"] = api_path
+        if self.snapshot:
+            span["cache"] = "snapshot"
+            return self._read_snapshot(url)
+        span["cache"] = "shared" # Waited on a concurrent fetch of the same URL
+        return self._in_flight.run(url, lambda: self._fetch(url, span, revalidate))
+
+    def _read_snapshot(self, url):
+        """Serve a request from the offline snapshot."""
+        api_path = url[len(self.BASE_URL):] if url.startswith(self.BASE_URL) else url
+        body = self.snapshot.get(api_path)
+        if body is None:
+            print(f"ERROR: {api_path} is not included in offline snapshot {self.snapshot.path}.")
+            return None
+        return self._decode_json(url, body)
+
+    def _fetch(self, url, span=None, revalidate=False):
+        """
+        Fetch and decode one URL, revalidating or filling the cache and retrying transient failures.
+
+        span, if given, receives the cache outcome (hit, revalidated, miss or stale) and body size.
+        """
+        span = span if span is not None else {}
+        cached = self.cache.get(url) if self.cache else None
+        if cached and cached["fresh"] and not revalidate:
+            span.update(cache="hit", bytes=len(cached["body"]))
+            return self._decode_json(url, cached["body"])
+        span["cache"] = "miss"
+
+        headers = dict(self.headers)
+        if cached:
+            # Stale entry for a mutable endpoint: revalidate instead of re-downloading
+            if cached["etag"]:
+                headers["If-None-Match"] = cached["etag"]
+            if cached["last_modified"]:
+                headers["If-Modified-Since"] = cached["last_modified"]
+
+        response = None
         try:
-            response = requests.get(url, headers=self.headers)
+            response = get_with_retries(self.session, url, headers,
+                                        rate_limiter=self.rate_limiter,
+                                        max_retries=self.max_retries,
+                                        timeout=self.REQUEST_TIMEOUT)
+            if response.status_code == 304 and cached:
+                self.cache.touch(url)
+                span.update(cache="revalidated", bytes=len(cached["body"]))
+                return self._decode_json(url, cached["body"])
             response.raise_for_status() # Raise HTTPError for bad responses (4xx or 5xx)
-            return response.json()
         except requests.exceptions.RequestException as e:
             print(f"ERROR: API request failed for {url}. Error: {e}")
             # Attempt to parse error details from response if available
             try:
                 error_details = response.json()
                 print(f"API Error Details: {json.dumps(error_details, indent=2)}")
-            except (AttributeError, json.JSONDecodeError):
+            except (AttributeError, ValueError):
                 pass # No JSON body or response object doesn't exist
+            if cached:
+                print(f"Warning: Using stale cached response for {url}.")
+                span.update(cache="stale", bytes=len(cached["body"]))
+                return self._decode_json(url, cached["body"])
+            span["error"] = type(e).__name__
             return None
-        except json.JSONDecodeError:
+
+        span["bytes"] = len(response.content)
+        data = self._decode_json(url, response.content)
+        if data is not None and self.cache:
+            self.cache.put(url, response.content,
+                           etag=response.headers.get("ETag"),
+                           last_modified=response.headers.get("Last-Modified"))
+        return data
+
+    def _decode_json(self, url, body):
+        """Decode a raw JSON response body, returning None if it is not valid JSON."""
+        try:
+            with tracer.span("json.decode", bytes=len(body)):
+                return json.loads(body)
+        except (json.JSONDecodeError, UnicodeDecodeError):
             print(f"ERROR: Failed to decode JSON response from {url}")
-            print(f"Response text: {response.text[:500]}...") # Print first 500 chars
+            print(f"Response text: {body[:500].decode('utf-8', errors='replace')}...") # Print first 500 chars
             return None
 
     # Removed get_latest_adamig_version function as per reference script analysis
     # def get_latest_adamig_version(self): ...
 
-    def get_latest_ct_version_for_standard(self, standard):
-        """Retrieve the latest Controlled Terminology version for a given standard (e.g., adamct, sdtmct)."""
+    @tracer.traced("ct.latest_version", "standard")
+    def get_latest_ct_version_for_standard(self, standard, refresh=False):
+        """
+        Retrieve the latest Controlled Terminology version for a given standard (e.g., adamct, sdtmct).
+
+        A version pinned by refresh_latest_ct_versions is returned without a request;
+        refresh=True ignores it and revalidates the Terminology listing with the API.
+        """
+        pinned = self._pinned_ct_versions.get(standard)
+        if pinned and not refresh:
+            return pinned
         print(f"Fetching latest {standard} version...")
+        return self._latest_ct_versions([standard], revalidate=refresh)[standard]
+
+    def _latest_ct_versions(self, standards, revalidate=False):
+        """
+        Find the latest CT version of each standard from a single Terminology listing request.
+
+        Returns standard -> version, with None for standards that have no packages listed.
+        """
         url = f"{self.BASE_URL}/mdr/products/Terminology"
-        data = self._make_request(url)
+        data = self._make_request(url, revalidate=revalidate)
 
         if not data or "_links" not in data or "packages" not in data["_links"]:
             print(f"ERROR: Could not find Terminology packages in API response.")
-            return None
+            return {standard: None for standard in standards}
 
         ct_links = data["_links"]["packages"]
-        versions = []
-        package_prefix = f"/{standard}-" # e.g., /adamct- or /sdtmct-
+        versions = {standard: [] for standard in standards}
         for link in ct_links:
             href = link.get("href", "")
             # Look for packages like /mdr/ct/packages/adamct-YYYY-MM-DD or /mdr/ct/packages/sdtmct-YYYY-MM-DD
-            if package_prefix in href:
+            for standard in standards:
+                package_prefix = f"/{standard}-" # e.g., /adamct- or /sdtmct-
+                if package_prefix not in href:
+                    continue
                 try:
                     version_date = href.split(package_prefix)[-1]
                     # Validate date format YYYY-MM-DD
-                    datetime.strptime(version_date, '%Y-%m-%d') # Corrected quotes
-                    versions.append(version_date)
+                    datetime.strptime(version_date, '%Y-%m-%d')
+                    versions[standard].append(version_date)
                 except (IndexError, ValueError):
                     continue # Skip if format is wrong
 
-        if not versions:
-            print(f"ERROR: No {standard} versions found.")
-            return None
-
-        # Sort dates chronologically
-        latest_version = sorted(versions, reverse=True)[0]
-        print(f"Latest {standard} version found: {latest_version}")
-        return latest_version
+        latest_versions = {}
+        for standard in standards:
+            if not versions[standard]:
+                print(f"ERROR: No {standard} versions found.")
+                latest_versions[standard] = None
+                continue
+            # Sort dates chronologically
+            latest_versions[standard] = sorted(versions[standard], reverse=True)[0]
+            print(f"Latest {standard} version found: {latest_versions[standard]}")
+        return latest_versions
 
-    def _find_variable_dataset(self, adam_variable, adamig_version):
-        """Determine the dataset structure name (e.g., ADSL, OCCDS) for a given variable."""
-        # Ensure adamig_version uses hyphen format (e.g., "1-3")
+    def get_variable_index(self, adamig_version):
+        """Return the variable index for an ADaMIG version, building it on first use."""
         adamig_version_hyphen = adamig_version.replace(".", "-")
-        print(f"Fetching ADaMIG structure for version {adamig_version_hyphen} to find dataset for {adam_variable}...")
+        return self._memoized(self._variable_indexes, adamig_version_hyphen,
+                              lambda: self._build_variable_index(adamig_version_hyphen))
+
+    def _build_variable_index(self, adamig_version_hyphen):
+        """Download an ADaMIG document and index its variables."""
+        print(f"Fetching ADaMIG structure for version {adamig_version_hyphen}...")
         url = f"{self.BASE_URL}/mdr/adam/adamig-{adamig_version_hyphen}"
         data = self._make_request(url)
 
@@ -98,30 +454,51 @@ class ADaMMetadataRetriever:
             print(f"ERROR: Could not fetch or parse ADaMIG structure for version {adamig_version_hyphen}.")
             return None
 
-        # Simplified logic: Iterate through structures and variables directly
-        for ds in data.get("dataStructures", []):
-            ds_name = ds.get("name")
-            if not ds_name:
-                continue # Skip structures without a name
+        return ADaMIGVariableIndex(adamig_version_hyphen, data)
 
-            # Check variables directly within the data structure (less common but possible)
-            for var in ds.get("analysisVariables", []): # Check top-level vars in DS first
-                 if var.get("name", "").upper() == adam_variable.upper():
-                     print(f"Variable {adam_variable} found directly in dataset structure: {ds_name}")
-                     return ds_name
+    def _variable_url(self, adamig_version_hyphen, dataset, variable_name):
+        """URL of the per-variable endpoint, used when the ADaMIG document lacks details."""
+        return f"{self.BASE_URL}/mdr/adam/adamig-{adamig_version_hyphen}/datastructures/{dataset}/variables/{variable_name}"
 
-            # Check variables within analysisVariableSets (more common)
-            for var_set in ds.get("analysisVariableSets", []):
-                for var in var_set.get("analysisVariables", []):
-                    if var.get("name", "").upper() == adam_variable.upper():
-                        print(f"Variable {adam_variable} found in dataset structure: {ds_name}")
-                        return ds_name # Return the name of the structure containing the variable
+    def _detail_urls(self, index):
+        """Per-variable endpoint URLs of every variable whose IG entry lacks reported fields."""
+        return [
+            self._variable_url(index.adamig_version, entry["Dataset"], entry["Variable"]["name"])
+            for entries in index.variables.values()
+            for entry in entries
+            if not index.has_details(entry["Variable"])
+        ]
+
+    @tracer.traced("ig.find_variable", variable="adam_variable")
+    def _find_variable_dataset(self, adam_variable, adamig_version):
+        """Determine the dataset structure name (e.g., ADSL, OCCDS) for a given variable."""
+        span = tracer.current()
+        # Ensure adamig_version uses hyphen format (e.g., "1-3")
+        adamig_version_hyphen = adamig_version.replace(".", "-")
+        index = self.get_variable_index(adamig_version_hyphen)
+        if not index:
+            return None
 
-        print(f"ERROR: Variable 	{adam_variable}	 not found in any dataset structure for ADaMIG {adamig_version_hyphen}.")
-        return None
+        entries = index.lookup(adam_variable)
+        if not entries:
+            print(f"ERROR: Variable \t{adam_variable}\t not found in any dataset structure for ADaMIG {adamig_version_hyphen}.")
+            return None
+
+        ds_name = entries[0]["Dataset"]
+        span["dataset"] = ds_name
+        print(f"Variable {adam_variable} found in dataset structure: {ds_name}")
+        return ds_name
 
-    def get_variable_details(self, adam_variable, adamig_version):
-        """Fetch details for a specific ADaM variable."""
+    @tracer.traced("variable.details", variable="adam_variable")
+    def get_variable_details(self, adam_variable, adamig_version, ct_versions=None, include_codelists=True):
+        """
+        Fetch details for a specific ADaM variable.
+
+        ct_versions, if given, is a dict of standard -> CT version shared between calls
+        so a batch resolves the latest adamct/sdtmct versions only once. With
+        include_codelists=False, "Codelists" is left empty so the caller can fill it
+        progressively with iter_codelists.
+        """
         # ADaMIG version is now required
         if not adamig_version:
              raise ValueError("ADaMIG version is required.")
@@ -134,17 +511,35 @@ class ADaMMetadataRetriever:
             # Error message already printed in _find_variable_dataset
             return None
 
-        print(f"Fetching details for {dataset}.{adam_variable} (ADaMIG {adamig_version_hyphen})...")
-        url = f"{self.BASE_URL}/mdr/adam/adamig-{adamig_version_hyphen}/datastructures/{dataset}/variables/{adam_variable}"
-        data = self._make_request(url)
+        # The ADaMIG document usually embeds the full variable payload; only fall back
+        # to the per-variable endpoint when it lacks fields we report.
+        index = self._variable_indexes[adamig_version_hyphen]
+        data = index.lookup(adam_variable)[0]["Variable"]
+        if not index.has_details(data):
+            print(f"Fetching details for {dataset}.{adam_variable} (ADaMIG {adamig_version_hyphen})...")
+            url = self._variable_url(adamig_version_hyphen, dataset, data.get("name", adam_variable))
+            data = self._make_request(url)
 
         if not data:
             print(f"ERROR: Could not fetch details for variable {adam_variable} in dataset {dataset}.")
             return None
 
+        details = self.variable_details_from_payload(data, dataset, adamig_version_hyphen)
+        if details["IGVariable"] and details["IGVariable"].upper() != adam_variable.upper():
+            # A numbered name (TRT01P) resolved through its IG placeholder (TRTxxP); report the name asked for
+            details["Variable"] = adam_variable.upper()
+        if include_codelists:
+            details["Codelists"].extend(self.iter_codelists(details, ct_versions=ct_versions))
+
+        return details
+
+    @staticmethod
+    def variable_details_from_payload(data, dataset, adamig_version_hyphen):
+        """Extract the reported fields of a variable payload into a details dict with empty "Codelists"."""
         # Extract key details (similar to SAS macro output)
         details = {
             "Variable": data.get("name"),
+            "IGVariable": data.get("name"), # Name in the IG; a placeholder such as TRTxxP for numbered variables
             "Label": data.get("label"),
             "DataType": data.get("simpleDatatype"),
             "Core": data.get("core"),
@@ -155,160 +550,462 @@ class ADaMMetadataRetriever:
             "Codelists": [] # To store fetched codelist details later
         }
 
-        # Extract codelist links and determine standard
-        codelist_info_list = [] # Store tuples of (codelist_id, standard, href)
+        # Extract codelist links
         if "_links" in data and "codelist" in data["_links"]:
             for link in data["_links"]["codelist"]:
                 href = link.get("href")
                 if href:
                     details["CodelistLinks"].append(href)
-                    try:
-                        # Example href: /mdr/root/ct/sdtmct/codelists/C66781
-                        parts = href.split("/")
-                        codelist_id = parts[-1]
-                        standard = parts[-3] # Should be sdtmct or adamct
-                        if codelist_id.startswith("C") and codelist_id[1:].isdigit() and standard in ["sdtmct", "adamct"]:
-                            codelist_info_list.append((codelist_id, standard, href))
-                        else:
-                            print(f"Warning: Could not parse standard/ID from codelist href: {href}")
-                    except IndexError:
-                        print(f"Warning: Could not parse codelist href: {href}")
-                        continue
-
-        if codelist_info_list:
-            unique_codelists = {info[0]: info for info in codelist_info_list}.values() # Deduplicate by ID
-            codelist_summary = ", ".join([f"{info[0]} ({info[1]})" for info in unique_codelists])
-            print(f"Found codelist references: {codelist_summary}")
-
-            # Fetch terms for these codelists
-            fetched_versions = {} # Cache fetched versions per standard
-            for cl_id, standard, href in unique_codelists:
-                if standard not in fetched_versions:
-                    ct_version = self.get_latest_ct_version_for_standard(standard)
-                    if not ct_version:
-                        print(f"Warning: Could not fetch latest {standard} version, skipping codelist {cl_id}.")
-                        fetched_versions[standard] = None # Mark as failed
-                        continue
-                    fetched_versions[standard] = ct_version
-                
-                ct_version = fetched_versions[standard]
-                if ct_version:
-                    # Pass standard and version to get_codelist_terms
-                    codelist_data = self.get_codelist_terms(cl_id, standard, ct_version)
-                    if codelist_data:
-                        details["Codelists"].append(codelist_data)
-                # else: Warning already printed
-        else:
+        return details
+
+    def codelist_references(self, details):
+        """Parse the codelist HREFs of a variable into unique (codelist_id, standard, href) tuples."""
+        codelist_info_list = [] # Store tuples of (codelist_id, standard, href)
+        for href in details.get("CodelistLinks", []):
+            try:
+                # Example href: /mdr/root/ct/sdtmct/codelists/C66781
+                parts = href.split("/")
+                codelist_id = parts[-1]
+                standard = parts[-3] # Should be sdtmct or adamct
+                if codelist_id.startswith("C") and codelist_id[1:].isdigit() and standard in ["sdtmct", "adamct"]:
+                    codelist_info_list.append((codelist_id, standard, href))
+                else:
+                    print(f"Warning: Could not parse standard/ID from codelist href: {href}")
+            except IndexError:
+                print(f"Warning: Could not parse codelist href: {href}")
+                continue
+        return list({info[0]: info for info in codelist_info_list}.values()) # Deduplicate by ID
+
+    def iter_codelists(self, details, ct_versions=None, ordered=True):
+        """
+        Fetch the codelists referenced by a variable's details, yielding each one's terms.
+
+        Lookups run concurrently on the worker pool. With ordered=False, codelists are
+        yielded as soon as each finishes loading rather than in reference order.
+        """
+        unique_codelists = self.codelist_references(details)
+        if not unique_codelists:
             print("No codelist references found for this variable.")
+            return
 
-        return details
+        codelist_summary = ", ".join([f"{info[0]} ({info[1]})" for info in unique_codelists])
+        print(f"Found codelist references: {codelist_summary}")
 
-    def get_codelist_terms(self, codelist_code, standard, ct_version):
-        """Fetch terms for a specific codelist code from the specified CT package (standard and version)."""
-        print(f"Fetching terms for Codelist Code {codelist_code} ({standard} version {ct_version})...")
-        # Construct URL using the provided standard
+        # Resolve the latest CT version of each referenced standard, then fetch the
+        # codelists; independent lookups run concurrently on the worker pool
+        fetched_versions = ct_versions if ct_versions is not None else {} # Cache fetched versions per standard
+        standards = sorted({info[1] for info in unique_codelists})
+        list(self._executor.map(lambda standard: self._resolve_ct_version(standard, fetched_versions), standards))
+
+        def fetch_codelist(info):
+            cl_id, standard, href = info
+            ct_version = fetched_versions.get(standard)
+            if not ct_version:
+                print(f"Warning: Could not fetch latest {standard} version, skipping codelist {cl_id}.")
+                return None
+            # Pass standard and version to get_codelist_terms
+            return self.get_codelist_terms(cl_id, standard, ct_version)
+
+        if ordered:
+            results = self._executor.map(fetch_codelist, unique_codelists)
+        else:
+            results = (future.result() for future in
+                       as_completed([self._executor.submit(fetch_codelist, info) for info in unique_codelists]))
+        for codelist_data in results:
+            if codelist_data:
+                yield codelist_data
+
+    def _resolve_ct_version(self, standard, ct_versions):
+        """Return the latest CT version for a standard, looking it up at most once per ct_versions dict."""
+        return self._memoized(ct_versions, standard,
+                              lambda: self.get_latest_ct_version_for_standard(standard),
+                              store_none=True) # Mark failures so they are not retried
+
+    def get_variables_details(self, adam_variables, adamig_version):
+        """
+        Fetch details for many ADaM variables in one pass.
+
+        The ADaMIG document, the Terminology listing and each CT package are fetched
+        once and shared by every variable. Returns the details of each variable that
+        was found, in input order.
+        """
+        # Fetch the ADaMIG document before fanning out across variables
+        if not self.get_variable_index(adamig_version):
+            return []
+
+        # Variables are resolved on their own short-lived pool: each one waits on
+        # codelist fetches submitted to self._executor, so sharing it could deadlock
+        ct_versions = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            all_details = list(pool.map(
+                lambda adam_variable: self.get_variable_details(adam_variable, adamig_version, ct_versions=ct_versions),
+                adam_variables
+            ))
+
+        results = []
+        for adam_variable, details in zip(adam_variables, all_details):
+            if details:
+                results.append(details)
+            else:
+                print(f"Warning: Could not retrieve details for variable '{adam_variable}', skipping.")
+        return results
+
+    def iter_ig_variables(self, adamig_version, ct_versions=None, datasets=None, window=None):
+        """
+        Yield the details of every variable in an ADaMIG version, codelists included (bulk export).
+
+        Data structures (optionally only those named in datasets) are walked in IG order.
+        Per-variable fetches, needed only when the IG document lacks a variable's details,
+        run on the worker pool at most `window` entries ahead of the consumer, and each
+        referenced codelist is decoded once and shared by every variable using it, so
+        memory stays bounded however large the export. ct_versions maps standard -> CT
+        version; other standards use their latest release.
+        """
+        adamig_version_hyphen = adamig_version.replace(".", "-")
+        index = self.get_variable_index(adamig_version_hyphen)
+        if not index:
+            return
+
+        wanted = {name.upper() for name in datasets} if datasets else None
+        entries = (entry for ds_name, ds_entries in index.datasets.items()
+                   if wanted is None or ds_name.upper() in wanted
+                   for entry in ds_entries)
+
+        ct_versions = dict(ct_versions or {})
+        codelists = {} # (standard, codelist ID) -> processed codelist, or None if missing
+
+        def load_codelist(cl_id, standard):
+            ct_version = self._resolve_ct_version(standard, ct_versions)
+            package = self.get_ct_package(standard, ct_version) if ct_version else None
+            cl_info = package.get_codelist(cl_id) if package else None
+            if not cl_info:
+                print(f"WARNING: Codelist Code \t{cl_id}\t not found in {standard} version {ct_version}.")
+            return cl_info
+
+        def load(entry):
+            data = entry["Variable"]
+            if not index.has_details(data):
+                data = self._make_request(self._variable_url(adamig_version_hyphen, entry["Dataset"], data.get("name")))
+                if not data:
+                    print(f"ERROR: Could not fetch details for variable {entry['Variable'].get('name')} in dataset {entry['Dataset']}.")
+                    return None
+            details = self.variable_details_from_payload(data, entry["Dataset"], adamig_version_hyphen)
+            for cl_id, standard, href in self.codelist_references(details):
+                cl_info = self._memoized(codelists, (standard, cl_id),
+                                         lambda: load_codelist(cl_id, standard), store_none=True)
+                if cl_info:
+                    details["Codelists"].append(cl_info)
+            return details
+
+        for details in self._map_bounded(load, entries, window or 4 * self.max_workers):
+            if details:
+                yield details
+
+    def _map_bounded(self, fn, items, window):
+        """Like executor.map over an iterator, but never more than `window` results ahead of the consumer."""
+        pending = deque()
+        for item in items:
+            pending.append(self._executor.submit(fn, item))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+    def get_ct_package(self, standard, ct_version):
+        """Return the parsed CT package for a standard and version, downloading it on first use."""
+        key = (standard, ct_version)
+        package = self._memoized(self._ct_packages, key, lambda: self._build_ct_package(standard, ct_version))
+        if key in self._superseded_ct_versions:
+            # A lookup that started before a refresh still gets the old release, but must not
+            # memoize it again after refresh_latest_ct_versions dropped it
+            self._ct_packages.pop(key, None)
+        return package
+
+    def _ct_package_path(self, standard, ct_version):
+        """Location of the converted package file in the cache directory, or None when uncached."""
+        if not self.cache:
+            return None
+        return self.cache.file_path(f"{standard}-{ct_version}{CTPackage.FILE_EXTENSION}")
+
+    @tracer.traced("ct.package", "standard", version="ct_version")
+    def _build_ct_package(self, standard, ct_version):
+        """Load a converted CT package, downloading and converting it on first use."""
+        span = tracer.current()
+        # Versioned packages never change, so a converted file is reused as-is
+        package_path = self._ct_package_path(standard, ct_version)
+        if package_path and os.path.exists(package_path):
+            try:
+                span["source"] = "file"
+                package = CTPackage.open(package_path)
+                self.cache.touch_file(package_path)
+                return package
+            except (OSError, ValueError) as e:
+                print(f"Warning: Could not open {package_path} ({e}); rebuilding it.")
+
+        print(f"Fetching {standard} package version {ct_version}...")
+        span["source"] = "api"
         url = f"{self.BASE_URL}/mdr/ct/packages/{standard}-{ct_version}"
-        data = self._make_request(url)
+        if package_path:
+            # Parse the download as it arrives, straight into the package file
+            try:
+                self._stream_ct_package(url, package_path, standard, ct_version)
+                package = CTPackage.open(package_path)
+                if len(package):
+                    self.cache.add_file(package_path) # Counted against the cache size budget
+                    return package
+                print(f"ERROR: {standard} package version {ct_version} has no codelists.")
+                os.remove(package_path)
+                return None
+            except (requests.exceptions.RequestException, urllib3.exceptions.HTTPError, ValueError) as e:
+                print(f"ERROR: Could not fetch or parse {standard} package version {ct_version}. Error: {e}")
+                return None
+            except OSError as e:
+                print(f"Warning: Could not write {package_path} ({e}); keeping the package in memory.")
 
+        data = self._make_request(url)
         if not data or "codelists" not in data:
             print(f"ERROR: Could not fetch or parse {standard} package version {ct_version}.")
             return None
+        return CTPackage.from_json(standard, ct_version, data)
 
-        target_codelist = None
-        for codelist in data.get("codelists", []):
-            # Match using conceptId (C-code)
-            if codelist.get("conceptId", "").upper() == codelist_code.upper():
-                target_codelist = codelist
-                break
-
-        if not target_codelist:
-            # Also check submissionValue as a fallback, though conceptId is preferred
-            for codelist in data.get("codelists", []):
-                 if codelist.get("submissionValue", "").upper() == codelist_code.upper():
-                     target_codelist = codelist
-                     print(f"Note: Matched codelist {codelist_code} using submissionValue.")
-                     break
-
-        if not target_codelist:
-            print(f"WARNING: Codelist Code 	{codelist_code}	 not found in {standard} version {ct_version}.")
-            return None
+    def _stream_ct_package(self, url, package_path, standard, ct_version):
+        """
+        Download a CT package and convert it into package_path in one incremental pass.
 
-        # Process the target codelist (similar to cdisc_codelist.py)
-        cl_info = {
-            "ID": target_codelist.get("submissionValue", ""),
-            "CodelistCode": target_codelist.get("conceptId", ""),
-            "Name": target_codelist.get("name", ""),
-            "ExtensibleYN": "Yes" if target_codelist.get("extensible", False) else "No",
-            "Standard": standard, # Add standard info
-            "Version": ct_version, # Add version info
-            "Terms": []
-        }
+        The multi-megabyte document is neither buffered nor decoded into a full object
+        tree, and it is not kept in the response cache: the package file replaces it.
+        """
+        response = get_with_retries(self.session, url, self.headers,
+                                    rate_limiter=self.rate_limiter,
+                                    max_retries=self.max_retries,
+                                    timeout=self.REQUEST_TIMEOUT,
+                                    stream=True)
+        with response:
+            response.raise_for_status()
+            response.raw.decode_content = True # Parse the body after gzip decoding
+            with tracer.span("ct.convert", standard=standard, version=ct_version):
+                CTPackage.write_from_file(package_path, standard, ct_version, response.raw)
+
+    @tracer.traced("ct.codelist", "standard", codelist="codelist_code", version="ct_version")
+    def get_codelist_terms(self, codelist_code, standard, ct_version):
+        """Fetch terms for a specific codelist code from the specified CT package (standard and version)."""
+        span = tracer.current()
+        print(f"Fetching terms for Codelist Code {codelist_code} ({standard} version {ct_version})...")
+        package = self.get_ct_package(standard, ct_version)
+        if not package:
+            return None
 
-        for term in target_codelist.get("terms", []):
-            cl_info["Terms"].append({
-                "TermCode": term.get("conceptId", ""),
-                "TERM": term.get("submissionValue", ""),
-                "TermDecodedValue": term.get("preferredTerm", "")
-            })
+        cl_info = package.get_codelist(codelist_code)
+        if not cl_info:
+            print(f"WARNING: Codelist Code \t{codelist_code}\t not found in {standard} version {ct_version}.")
+            return None
 
-        # Sort terms by submission value
-        cl_info["Terms"].sort(key=lambda x: x.get("TERM", ""))
         # Extract values before f-string to avoid quote issues
         num_terms = len(cl_info["Terms"])
+        span["terms"] = num_terms
         cl_id = cl_info["ID"]
         cl_code = cl_info["CodelistCode"]
         print(f"Successfully fetched {num_terms} terms for {cl_id} ({cl_code} from {standard} {ct_version}).")
         return cl_info
 
+    def resolve_ct_package_spec(self, spec):
+        """Turn "sdtmct-2024-03-29" into ("sdtmct", "2024-03-29"); a bare "sdtmct" resolves to its latest version."""
+        match = re.match(r"^([a-z]+)-(\d{4}-\d{2}-\d{2})$", spec)
+        if match:
+            return match.group(1), match.group(2)
+        ct_version = self.get_latest_ct_version_for_standard(spec)
+        return (spec, ct_version) if ct_version else None
+
+    def export_snapshot(self, output_path, adamig_versions, ct_package_specs):
+        """
+        Download ADaMIG versions and CT packages and save them as an offline snapshot.
+
+        ct_package_specs are "standard-YYYY-MM-DD" or a bare standard for its latest
+        version. Returns the snapshot manifest, or None if anything failed to download.
+        """
+        responses = {}
+        for adamig_version in adamig_versions:
+            adamig_version_hyphen = adamig_version.replace(".", "-")
+            api_path = f"/mdr/adam/adamig-{adamig_version_hyphen}"
+            print(f"Fetching ADaMIG structure for version {adamig_version_hyphen}...")
+            data = self._make_request(self.BASE_URL + api_path)
+            if not data or "dataStructures" not in data:
+                print(f"ERROR: Could not fetch or parse ADaMIG structure for version {adamig_version_hyphen}.")
+                return None
+            responses[api_path] = data
+
+            # Variables whose IG entry lacks reported fields are looked up individually, so include those too
+            variable_urls = self._detail_urls(ADaMIGVariableIndex(adamig_version_hyphen, data))
+            for url, variable_data in zip(variable_urls, self._executor.map(self._make_request, variable_urls)):
+                if variable_data:
+                    responses[url[len(self.BASE_URL):]] = variable_data
+
+        ct_packages = []
+        for spec in ct_package_specs:
+            resolved = self.resolve_ct_package_spec(spec)
+            if not resolved:
+                print(f"ERROR: Could not resolve CT package {spec}.")
+                return None
+            ct_packages.append(f"{resolved[0]}-{resolved[1]}")
+
+        package_paths = [f"/mdr/ct/packages/{package}" for package in ct_packages]
+        print(f"Fetching CT packages: {', '.join(ct_packages)}...")
+        for api_path, data in zip(package_paths, self._executor.map(lambda path: self._make_request(self.BASE_URL + path), package_paths)):
+            if not data or "codelists" not in data:
+                print(f"ERROR: Could not fetch or parse CT package {api_path}.")
+                return None
+            responses[api_path] = data
+
+        manifest = Snapshot.write(output_path, responses, [v.replace(".", "-") for v in adamig_versions],
+                                  ct_packages, self.BASE_URL)
+        print(f"Snapshot saved to {output_path} ({len(manifest['paths'])} documents).")
+        return manifest
+
+    @tracer.traced("ct.refresh")
+    def refresh_latest_ct_versions(self, standards=DEFAULT_CT_STANDARDS, revalidate=True):
+        """
+        Check the API for new CT releases and pin each standard's latest version.
+
+        The Terminology listing is revalidated once (or, with revalidate=False, served from
+        the cache while fresh) and every standard is resolved from it.
+
+        A new release is downloaded and converted before it is pinned, and every pin
+        is swapped in with a single assignment, so concurrent lookups see either the
+        old or the new releases, never a half-loaded one. Returns standard -> version
+        for the standards that changed.
+        """
+        span = tracer.current()
+        pinned = dict(self._pinned_ct_versions)
+        latest_versions = self._latest_ct_versions(standards, revalidate=revalidate)
+        updated = {}
+        for standard in standards:
+            ct_version = latest_versions[standard]
+            if not ct_version or ct_version == pinned.get(standard):
+                continue
+            if not self.get_ct_package(standard, ct_version):
+                print(f"Warning: Keeping {standard} version {pinned.get(standard)}; version {ct_version} failed to load.")
+                continue
+            updated[standard] = ct_version
+
+        if updated:
+            self._pinned_ct_versions = {**pinned, **updated}
+            self._superseded_ct_versions -= set(updated.items())
+            # Drop the superseded packages; lookups still holding one finish with it. They are
+            # marked first so get_ct_package cannot memoize one again after the pop.
+            for standard, ct_version in pinned.items():
+                if standard in updated:
+                    self._superseded_ct_versions.add((standard, ct_version))
+                    self._ct_packages.pop((standard, ct_version), None)
+        span["updated"] = ", ".join(f"{standard}-{ct_version}" for standard, ct_version in updated.items())
+        return updated
+
+    @tracer.traced("warm_up")
+    def warm_up(self, adamig_versions=("1-3",), standards=DEFAULT_CT_STANDARDS):
+        """
+        Load what lookups need before a long-running server takes requests.
+
+        Builds the ADaMIG variable indexes, fills the response cache with the per-variable
+        payloads the IG documents lack, and pins the latest release of each CT standard
+        (see refresh_latest_ct_versions). Returns True if everything loaded.
+        """
+        span = tracer.current()
+        complete = True
+        for adamig_version in adamig_versions:
+            adamig_version_hyphen = adamig_version.replace(".", "-")
+            index = self.get_variable_index(adamig_version_hyphen)
+            if not index:
+                complete = False
+                continue
+            if not all(list(self._executor.map(self._make_request, self._detail_urls(index)))):
+                complete = False
+
+        # A listing cached by an earlier warm-up (e.g., the warm-up command) is reused while fresh
+        self.refresh_latest_ct_versions(standards, revalidate=False)
+        complete = complete and all(standard in self._pinned_ct_versions for standard in standards)
+        span["complete"] = complete
+        return complete
+
+class CTReleaseRefresher(threading.Thread):
+    """Daemon thread that periodically swaps new CT releases into a retriever (see refresh_latest_ct_versions)."""
+
+    def __init__(self, retriever, interval, standards=DEFAULT_CT_STANDARDS):
+        """interval is the number of seconds between checks."""
+        super().__init__(name="adam-genius-ct-refresher", daemon=True)
+        self.retriever = retriever
+        self.interval = interval
+        self.standards = standards
+        self._stopped = threading.Event()
+
+    def run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                updated = self.retriever.refresh_latest_ct_versions(self.standards)
+            except Exception as e:
+                print(f"Warning: CT release refresh failed: {e}")
+                continue
+            for standard, ct_version in updated.items():
+                print(f"Now serving {standard} version {ct_version}.")
+
+    def stop(self):
+        self._stopped.set()
+
+def format_variable_details(details, include_codelists=True):
+    """Format variable details and associated codelists as the text display_variable_details prints."""
+    lines = []
+    lines.append("\n" + "="*70)
+    lines.append(f" ADaM Variable Details: {details.get('Dataset', 'N/A')}.{details.get('Variable', 'N/A')}")
+    lines.append(f" ADaMIG Version: {details.get('ADaMIGVersion', 'N/A')}")
+    if details.get('IGVariable') and details['IGVariable'] != details.get('Variable'):
+        lines.append(f" IG Variable:    {details['IGVariable']}")
+    lines.append("="*70)
+    lines.append(f"  Label:        {details.get('Label', 'N/A')}")
+    lines.append(f"  Data Type:    {details.get('DataType', 'N/A')}")
+    lines.append(f"  Core Status:  {details.get('Core', 'N/A')}")
+    lines.append(f"  CDISC Notes:  {details.get('CDISCNotes', 'N/A')}")
+    lines.append(f"  Codelist HREFs: {', '.join(details.get('CodelistLinks', ['N/A']))}")
+
+    if include_codelists:
+        if details.get("Codelists"):
+            lines.append("\n" + "-"*70)
+            lines.append(" Associated Codelist(s)")
+            lines.append("-"*70)
+            for cl in details["Codelists"]:
+                lines.append(f"\n  Codelist:     {cl.get('Name', 'N/A')} ({cl.get('ID', 'N/A')}) [{cl.get('CodelistCode', 'N/A')}]")
+                lines.append(f"  Extensible:   {cl.get('ExtensibleYN', 'N/A')}")
+                lines.append("  Terms:")
+                if cl.get("Terms"):
+                    lines.append("    {:<20} {:<40}".format("TERM", "Decoded Value"))
+                    lines.append("    " + "-" * 62)
+                    for term in cl["Terms"]:
+                        lines.append("    {:<20} {:<40}".format(term.get("TERM", ""), term.get("TermDecodedValue", "")))
+                else:
+                    lines.append("    No terms found.")
+        else:
+            lines.append("\nNo associated codelist terms were fetched or found.")
+    lines.append("\n" + "="*70)
+    return "\n".join(lines)
+
 def display_variable_details(details):
     """Display variable details and associated codelists in a formatted way."""
     if not details:
         print("No details to display.")
         return
 
-    print("\n" + "="*70)
-    print(f" ADaM Variable Details: {details.get('Dataset', 'N/A')}.{details.get('Variable', 'N/A')}")
-    print(f" ADaMIG Version: {details.get('ADaMIGVersion', 'N/A')}")
-    print("="*70)
-    print(f"  Label:        {details.get('Label', 'N/A')}")
-    print(f"  Data Type:    {details.get('DataType', 'N/A')}")
-    print(f"  Core Status:  {details.get('Core', 'N/A')}")
-    print(f"  CDISC Notes:  {details.get('CDISCNotes', 'N/A')}")
-    print(f"  Codelist HREFs: {', '.join(details.get('CodelistLinks', ['N/A']))}")
-
-    if details.get("Codelists"):
-        print("\n" + "-"*70)
-        print(" Associated Codelist(s)")
-        print("-"*70)
-        for cl in details["Codelists"]:
-            print(f"\n  Codelist:     {cl.get('Name', 'N/A')} ({cl.get('ID', 'N/A')}) [{cl.get('CodelistCode', 'N/A')}]")
-            print(f"  Extensible:   {cl.get('ExtensibleYN', 'N/A')}")
-            print("  Terms:")
-            if cl.get("Terms"):
-                print("    {:<20} {:<40}".format("TERM", "Decoded Value"))
-                print("    " + "-" * 62)
-                for term in cl["Terms"]:
-                    print("    {:<20} {:<40}".format(term.get("TERM", ""), term.get("TermDecodedValue", "")))
-            else:
-                print("    No terms found.")
-    else:
-        print("\nNo associated codelist terms were fetched or found.")
-    print("\n" + "="*70)
-
-def write_to_csv(details, output_file):
-    """Write variable details and terms to a CSV file."""
-    if not details:
-        print("No details to write to CSV.")
-        return
+    print(format_variable_details(details))
 
+def _details_to_rows(details):
+    """Flatten one variable's details and codelist terms into CSV rows."""
     rows = []
     # Basic variable info
     var_info = {
         "Parameter": "Variable", "Value": details.get('Variable', 'N/A'),
-        "Dataset": details.get('Dataset', 'N/A'), "ADaMIGVersion": details.get('ADaMIGVersion', 'N/A'),
+        "Dataset": details.get('Dataset', 'N/A'), "Variable": details.get('Variable', 'N/A'),
+        "ADaMIGVersion": details.get('ADaMIGVersion', 'N/A'),
         "CodelistID": "", "CodelistCode": "", "CodelistName": "", "ExtensibleYN": "",
         "TermCode": "", "TERM": "", "TermDecodedValue": ""
     }
+    if details.get('IGVariable') and details['IGVariable'] != details.get('Variable'):
+        rows.append({**var_info, "Parameter": "IGVariable", "Value": details['IGVariable']})
     rows.append({**var_info, "Parameter": "Label", "Value": details.get('Label', 'N/A')})
     rows.append({**var_info, "Parameter": "DataType", "Value": details.get('DataType', 'N/A')})
     rows.append({**var_info, "Parameter": "Core", "Value": details.get('Core', 'N/A')})
@@ -320,7 +1017,8 @@ def write_to_csv(details, output_file):
         for cl in details["Codelists"]:
             cl_base_info = {
                 "Parameter": "CodelistTerm", "Value": "",
-                "Dataset": details.get('Dataset', 'N/A'), "ADaMIGVersion": details.get('ADaMIGVersion', 'N/A'),
+                "Dataset": details.get('Dataset', 'N/A'), "Variable": details.get('Variable', 'N/A'),
+                "ADaMIGVersion": details.get('ADaMIGVersion', 'N/A'),
                 "CodelistID": cl.get('ID', 'N/A'), "CodelistCode": cl.get('CodelistCode', 'N/A'),
                 "CodelistName": cl.get('Name', 'N/A'), "ExtensibleYN": cl.get('ExtensibleYN', 'N/A')
             }
@@ -335,41 +1033,238 @@ def write_to_csv(details, output_file):
             else:
                  # Add a row indicating no terms for this codelist
                  rows.append({**cl_base_info, "TERM": "(No terms found)"})
+    return rows
+
+# Columns of the flattened rows written by write_to_csv and write_export
+CSV_FIELDNAMES = ["Dataset", "Variable", "ADaMIGVersion", "Parameter", "Value", "CodelistID", "CodelistCode", "CodelistName", "ExtensibleYN", "TermCode", "TERM", "TermDecodedValue"]
+
+def write_to_csv(details, output_file):
+    """
+    Write variable details and terms to a CSV file.
+
+    details may be a single variable's details or a list of them (batch mode).
+    An output_file ending in .json receives the details as a JSON array instead.
+    """
+    if not details:
+        print("No details to write to CSV.")
+        return
+
+    details_list = details if isinstance(details, list) else [details]
+
+    if output_file.lower().endswith(".json"):
+        try:
+            with open(output_file, 'w', encoding='utf-8') as jsonfile:
+                json.dump(details_list, jsonfile, indent=2)
+            print(f"\nResults saved to {output_file}")
+        except IOError as e:
+            print(f"ERROR: Could not write to JSON file {output_file}. Error: {e}")
+        return
+
+    rows = []
+    for var_details in details_list:
+        rows.extend(_details_to_rows(var_details))
 
     if not rows:
         print("No data generated for CSV.")
         return
 
-    fieldnames = ["Dataset", "ADaMIGVersion", "Parameter", "Value", "CodelistID", "CodelistCode", "CodelistName", "ExtensibleYN", "TermCode", "TERM", "TermDecodedValue"]
-
     try:
         with open(output_file, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+            writer = csv.DictWriter(csvfile, fieldnames=CSV_FIELDNAMES)
             writer.writeheader()
             writer.writerows(rows)
         print(f"\nResults saved to {output_file}")
     except IOError as e:
         print(f"ERROR: Could not write to CSV file {output_file}. Error: {e}")
 
-def main():
-    """Main function to run from command line."""
-    parser = argparse.ArgumentParser(description='Retrieve ADaM variable metadata from CDISC Library API')
-    parser.add_argument('adam_variable', help='The ADaM variable name (e.g., TRT01P, PARAMCD)')
+# Bulk export formats, selected by --format or the output file extension
+EXPORT_FORMATS = ("csv", "jsonl", "parquet")
+
+def export_format_for(output_file):
+    """Guess the export format from a file name, defaulting to CSV."""
+    extension = os.path.splitext(output_file)[1].lower().lstrip(".")
+    return extension if extension in EXPORT_FORMATS else "csv"
+
+def write_export(details_iter, output_file, fmt=None, batch_rows=50000):
+    """
+    Stream variable details from an iterator (e.g., iter_ig_variables) to a file.
+
+    csv and parquet receive the flattened rows of write_to_csv; jsonl receives one
+    details object per line. Only one variable (or, for parquet, one row group of
+    batch_rows rows) is held in memory at a time. Returns the number of variables written.
+    """
+    fmt = fmt or export_format_for(output_file)
+    count = 0
+    if fmt == "jsonl":
+        with open(output_file, 'w', encoding='utf-8') as f:
+            for details in details_iter:
+                f.write(json.dumps(details) + "\n")
+                count += 1
+    elif fmt == "csv":
+        with open(output_file, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDNAMES)
+            writer.writeheader()
+            for details in details_iter:
+                writer.writerows(_details_to_rows(details))
+                count += 1
+    elif fmt == "parquet":
+        import pyarrow as pa # Optional dependency, needed only for Parquet export
+        import pyarrow.parquet as pq
+        schema = pa.schema([(name, pa.string()) for name in CSV_FIELDNAMES])
+        batch = {name: [] for name in CSV_FIELDNAMES}
+
+        def flush(writer):
+            writer.write_table(pa.Table.from_pydict(batch, schema=schema))
+            for column in batch.values():
+                column.clear()
+
+        with pq.ParquetWriter(output_file, schema) as writer:
+            for details in details_iter:
+                for row in _details_to_rows(details):
+                    for name in CSV_FIELDNAMES:
+                        value = row.get(name)
+                        batch[name].append(None if value is None else str(value))
+                count += 1
+                if len(batch["Variable"]) >= batch_rows:
+                    flush(writer)
+            if batch["Variable"]:
+                flush(writer)
+    else:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    return count
+
+def read_variable_list(spec_file):
+    """
+    Read ADaM variable names from a spec file.
+
+    CSV files with a header column named "Variable" (case-insensitive) use that column;
+    anything else is read as one variable name per line (first column). Duplicates are dropped.
+    """
+    with open(spec_file, newline='', encoding='utf-8-sig') as f:
+        rows = [row for row in csv.reader(f) if any(cell.strip() for cell in row)]
+
+    column = 0
+    if rows:
+        header = [cell.strip().upper() for cell in rows[0]]
+        if "VARIABLE" in header:
+            column = header.index("VARIABLE")
+            rows = rows[1:]
+
+    variables = []
+    for row in rows:
+        if column < len(row):
+            name = row[column].strip().upper()
+            if name and name not in variables:
+                variables.append(name)
+    return variables
+
+def collect_variables(names, spec_file=None):
+    """Combine variables given on the command line with a spec file's, upper-cased and without duplicates."""
+    variables = []
+    for name in list(names or []) + (read_variable_list(spec_file) if spec_file else []):
+        name = name.strip().upper()
+        if name and name not in variables:
+            variables.append(name)
+    return variables
+
+def _positive_float(value):
+    """argparse type for options that must be greater than zero."""
+    number = float(value)
+    if number <= 0:
+        raise argparse.ArgumentTypeError(f"must be greater than 0, got {value}")
+    return number
+
+def _positive_int(value):
+    """argparse type for counts that must be at least 1."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
+def _non_negative_int(value):
+    """argparse type for counts that may be zero but not negative."""
+    number = int(value)
+    if number < 0:
+        raise argparse.ArgumentTypeError(f"must not be negative, got {value}")
+    return number
+
+def _add_connection_arguments(parser):
+    """Options shared by every command that talks to the CDISC Library API."""
+    parser.add_argument('--api_key', help='CDISC Library API key (optional, use .env file instead)')
+    parser.add_argument('--cache-dir', help='Directory for the persistent API response cache (default: ~/.cache/adam_genius)')
+    parser.add_argument('--no-cache', action='store_true', help='Disable the persistent API response cache')
+    parser.add_argument('--max-workers', type=_positive_int, default=ADaMMetadataRetriever.DEFAULT_MAX_WORKERS,
+                        help='Maximum concurrent API requests and pooled connections (default: 8)')
+    parser.add_argument('--rate-limit', type=_positive_float, default=ADaMMetadataRetriever.DEFAULT_RATE_LIMIT,
+                        help='Maximum API requests per second (default: 10)')
+    parser.add_argument('--max-retries', type=_non_negative_int, default=ADaMMetadataRetriever.DEFAULT_MAX_RETRIES,
+                        help='Retries for rate-limited (429), 5xx and failed connections (default: 4)')
+    parser.add_argument('--profile', action='store_true',
+                        help='Print a per-stage timing summary (requests, decoding, CT parsing) to stderr when done')
+    parser.add_argument('--profile-output', metavar='FILE', help='Save every timing span and the summary as JSON')
+
+def enable_profiling(print_summary=True, output_file=None):
+    """Record timing spans and report them when the process exits."""
+    tracer.enabled = True
+
+    def report():
+        if print_summary:
+            print("\n" + tracer.format_summary(), file=sys.stderr)
+        if output_file:
+            tracer.write_json(output_file)
+            print(f"Profile saved to {output_file}", file=sys.stderr)
+    atexit.register(report)
+
+def _retriever_from_args(args, offline=None):
+    """Build a retriever from the options added by _add_connection_arguments."""
+    if args.profile or args.profile_output:
+        enable_profiling(args.profile, args.profile_output)
+    return ADaMMetadataRetriever(api_key=args.api_key, cache_dir=args.cache_dir,
+                                 use_cache=not args.no_cache, max_workers=args.max_workers,
+                                 rate_limit=args.rate_limit, max_retries=args.max_retries,
+                                 offline=offline)
+
+def lookup_main(argv):
+    """Look up one or more ADaM variables (the default command)."""
+    parser = argparse.ArgumentParser(description='Retrieve ADaM variable metadata from CDISC Library API',
+                                     epilog='Other commands: ' + ', '.join(SUBCOMMANDS) + ' (run with -h for help)')
+    parser.add_argument('adam_variable', nargs='*', help='One or more ADaM variable names (e.g., TRT01P, PARAMCD)')
+    parser.add_argument('--from-file', help='Spec file (CSV with a Variable column, or one name per line) listing variables to resolve')
     # Make adamig_version required or default to '1-3'
     parser.add_argument('--adamig_version', default='1-3', help='Specific ADaMIG version (e.g., 1-3). Defaults to 1-3.')
-    parser.add_argument('--api_key', help='CDISC Library API key (optional, use .env file instead)')
-    parser.add_argument('--output', help='Output CSV file path')
+    parser.add_argument('--output', help='Output CSV file path (use a .json extension for JSON)')
+    parser.add_argument('--offline', metavar='SNAPSHOT', help='Serve all metadata from a snapshot archive instead of the API')
+    parser.add_argument('--format', choices=['text', 'json'], default='text',
+                        help='Output format on stdout; with json, progress messages go to stderr (default: text)')
+    _add_connection_arguments(parser)
 
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
-    try:
-        print("ADaM Metadata Retrieval Tool")
-        print("============================")
+    adam_variables = collect_variables(args.adam_variable, args.from_file)
+    if not adam_variables:
+        parser.error("provide at least one ADaM variable or --from-file")
 
-        retriever = ADaMMetadataRetriever(api_key=args.api_key)
+    if args.format == 'json':
+        # Keep stdout machine-readable: everything else is diagnostics
+        with redirect_stdout(sys.stderr):
+            retriever = _retriever_from_args(args, offline=args.offline)
+            results = retriever.get_variables_details(adam_variables, args.adamig_version)
+            if results and args.output:
+                write_to_csv(results, args.output)
+        output = results[0] if len(adam_variables) == 1 and results else results
+        print(json.dumps(output, indent=2))
+        if not results:
+            sys.exit(1)
+        return
+
+    print("ADaM Metadata Retrieval Tool")
+    print("============================")
+
+    retriever = _retriever_from_args(args, offline=args.offline)
+    if len(adam_variables) == 1:
         # Pass the required adamig_version
         result = retriever.get_variable_details(
-            adam_variable=args.adam_variable,
+            adam_variable=adam_variables[0],
             adamig_version=args.adamig_version
         )
 
@@ -378,8 +1273,310 @@ def main():
             if args.output:
                 write_to_csv(result, args.output)
         else:
-            print(f"\nCould not retrieve details for variable '{args.adam_variable}'.")
+            print(f"\nCould not retrieve details for variable '{adam_variables[0]}'.")
+    else:
+        # Batch mode: ADaMIG and CT packages are fetched once for all variables
+        results = retriever.get_variables_details(adam_variables, args.adamig_version)
+        for result in results:
+            display_variable_details(result)
+        print(f"\nResolved {len(results)} of {len(adam_variables)} variables.")
+        if results and args.output:
+            write_to_csv(results, args.output)
+
+def snapshot_main(argv):
+    """Download ADaMIG and CT releases into an offline snapshot archive."""
+    parser = argparse.ArgumentParser(prog='adam_genius.py snapshot',
+                                     description='Save ADaMIG and CT releases to a local snapshot for use with --offline')
+    parser.add_argument('output', help='Snapshot archive to write (e.g., cdisc-snapshot.zip)')
+    parser.add_argument('--adamig_version', action='append',
+                        help='ADaMIG version to include (repeatable). Defaults to 1-3.')
+    parser.add_argument('--ct', action='append', metavar='PACKAGE',
+                        help='CT package to include, as standard-YYYY-MM-DD or a bare standard for its latest '
+                             'version (repeatable). Defaults to the latest adamct and sdtmct.')
+    _add_connection_arguments(parser)
+    args = parser.parse_args(argv)
+
+    retriever = _retriever_from_args(args)
+    manifest = retriever.export_snapshot(args.output, args.adamig_version or ['1-3'], args.ct or ['adamct', 'sdtmct'])
+    if not manifest:
+        sys.exit(1)
+
+def warm_up_main(argv):
+    """Fill the on-disk cache before a long-running server (e.g., the Streamlit app) starts."""
+    parser = argparse.ArgumentParser(prog='adam_genius.py warm-up',
+                                     description='Download ADaMIG versions, their per-variable metadata and the latest CT '
+                                                 'packages into the cache, so a server started afterwards never waits on the API')
+    parser.add_argument('--adamig_version', action='append',
+                        help='ADaMIG version to load (repeatable). Defaults to 1-3.')
+    parser.add_argument('--ct', action='append', metavar='STANDARD',
+                        help='CT standard whose latest package to load (repeatable). Defaults to adamct and sdtmct.')
+    _add_connection_arguments(parser)
+    args = parser.parse_args(argv)
+    if args.no_cache:
+        parser.error("--no-cache leaves nothing to warm up")
+
+    retriever = _retriever_from_args(args)
+    if not retriever.warm_up(args.adamig_version or ['1-3'], args.ct or DEFAULT_CT_STANDARDS):
+        print("ERROR: Warm-up incomplete; see the messages above.")
+        sys.exit(1)
+    print(f"Cache warmed up in {retriever.cache.cache_dir}.")
+
+def export_main(argv):
+    """Export the metadata of every variable in an ADaMIG version, joined with its codelists."""
+    parser = argparse.ArgumentParser(prog='adam_genius.py export',
+                                     description='Export every ADaMIG variable with its codelist terms (define.xml/spec-ready)')
+    parser.add_argument('output', help='File to write (.csv, .jsonl or .parquet)')
+    parser.add_argument('--adamig_version', default='1-3', help='ADaMIG version to export. Defaults to 1-3.')
+    parser.add_argument('--dataset', action='append',
+                        help='Only export this data structure, e.g., ADSL or BDS (repeatable). Defaults to all.')
+    parser.add_argument('--ct', action='append', metavar='PACKAGE',
+                        help='CT package to join codelists against, as standard-YYYY-MM-DD or a bare standard '
+                             '(repeatable). Standards not given use their latest release.')
+    parser.add_argument('--format', choices=EXPORT_FORMATS,
+                        help='Output format (default: from the output file extension, else csv)')
+    parser.add_argument('--offline', metavar='SNAPSHOT', help='Serve all metadata from a snapshot archive instead of the API')
+    _add_connection_arguments(parser)
+    args = parser.parse_args(argv)
+
+    fmt = args.format or export_format_for(args.output)
+    if fmt == "parquet":
+        try:
+            import pyarrow # noqa: F401
+        except ImportError:
+            parser.error("Parquet export requires pyarrow (pip install pyarrow)")
+
+    retriever = _retriever_from_args(args, offline=args.offline)
+    ct_versions = {}
+    for spec in args.ct or []:
+        resolved = retriever.resolve_ct_package_spec(spec)
+        if not resolved:
+            print(f"ERROR: Could not resolve CT package {spec}.")
+            sys.exit(1)
+        ct_versions[resolved[0]] = resolved[1]
 
+    count = write_export(retriever.iter_ig_variables(args.adamig_version, ct_versions=ct_versions,
+                                                     datasets=args.dataset),
+                         args.output, fmt)
+    if not count:
+        print(f"ERROR: No variables exported for ADaMIG {args.adamig_version}.")
+        sys.exit(1)
+    print(f"Exported {count} variables to {args.output}")
+
+def validate_main(argv):
+    """Validate ADaM datasets against ADaMIG metadata and non-extensible codelists."""
+    from adam_validate import DatasetValidator, format_issues # pandas is only needed for validation
+
+    parser = argparse.ArgumentParser(prog='adam_genius.py validate',
+                                     description='Check ADaM datasets (.sas7bdat, .xpt, .parquet, .csv) against ADaMIG '
+                                                 'variable presence, datatypes and non-extensible codelists')
+    parser.add_argument('datasets', nargs='+', help='Dataset files to validate (e.g., adsl.xpt adlb.sas7bdat)')
+    parser.add_argument('--adamig_version', default='1-3', help='ADaMIG version to validate against. Defaults to 1-3.')
+    parser.add_argument('--structure', help='ADaMIG data structure for every dataset (default: ADSL by name, '
+                                            'BDS if PARAMCD is present, otherwise presence is not checked)')
+    parser.add_argument('--ct', action='append', metavar='PACKAGE',
+                        help='CT package for codelist checks, as standard-YYYY-MM-DD or a bare standard '
+                             '(repeatable). Standards not given use their latest release.')
+    parser.add_argument('--chunksize', type=_positive_int, default=DatasetValidator.DEFAULT_CHUNKSIZE,
+                        help='Rows read per chunk (default: 250000)')
+    parser.add_argument('--output', help='Write the issues to a CSV file (use a .json extension for JSON)')
+    parser.add_argument('--offline', metavar='SNAPSHOT', help='Serve all metadata from a snapshot archive instead of the API')
+    _add_connection_arguments(parser)
+    args = parser.parse_args(argv)
+
+    retriever = _retriever_from_args(args, offline=args.offline)
+    ct_versions = {}
+    for spec in args.ct or []:
+        resolved = retriever.resolve_ct_package_spec(spec)
+        if not resolved:
+            print(f"ERROR: Could not resolve CT package {spec}.")
+            sys.exit(1)
+        ct_versions[resolved[0]] = resolved[1]
+
+    validator = DatasetValidator(retriever, args.adamig_version, ct_versions=ct_versions)
+    issues = []
+    for path in args.datasets:
+        print(f"Validating {path}...")
+        issues.extend(validator.validate(path, structure=args.structure, chunksize=args.chunksize))
+
+    print("\n" + format_issues(issues))
+    if args.output:
+        if args.output.lower().endswith(".json"):
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(issues, f, indent=2, default=str)
+        else:
+            with open(args.output, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.DictWriter(f, fieldnames=["Dataset", "Variable", "Severity", "Check", "Message", "Rows", "Examples"])
+                writer.writeheader()
+                writer.writerows({**item, "Examples": ", ".join(str(value) for value in item["Examples"])} for item in issues)
+        print(f"\nIssues saved to {args.output}")
+
+    errors = sum(1 for item in issues if item["Severity"] == "ERROR")
+    print(f"\n{errors} error(s), {len(issues) - errors} other issue(s) in {len(args.datasets)} dataset(s).")
+    if errors:
+        sys.exit(1)
+
+def format_table(rows, empty_message="No results."):
+    """Format a list of dicts with the same keys (e.g., diff changes) as a plain-text table."""
+    if not rows:
+        return empty_message
+    fieldnames = list(rows[0])
+    widths = {name: min(40, max(len(name), *(len(str(row[name])) for row in rows))) for name in fieldnames}
+    lines = ["  ".join(name.ljust(widths[name]) for name in fieldnames)]
+    lines.append("  ".join("-" * widths[name] for name in fieldnames))
+    for row in rows:
+        lines.append("  ".join(str(row[name])[:widths[name]].ljust(widths[name]) for name in fieldnames))
+    return "\n".join(lines)
+
+def diff_main(argv):
+    """Compare two CT package versions or two ADaMIG versions."""
+    parser = argparse.ArgumentParser(prog='adam_genius.py diff',
+                                     description='Report added, removed and changed codelists/terms between two CT '
+                                                 'packages, or variables between two ADaMIG versions')
+    parser.add_argument('old', help='Older release: a CT package (e.g., sdtmct-2024-03-29) or an ADaMIG version (e.g., 1-2)')
+    parser.add_argument('new', help='Newer release of the same kind; a bare standard (e.g., sdtmct) means its latest CT package')
+    parser.add_argument('--variables', nargs='+', metavar='VARIABLE',
+                        help='Only report changes affecting these ADaM variables (for CT, the codelists they use)')
+    parser.add_argument('--from-file', help='Spec file listing the variables to restrict the diff to')
+    parser.add_argument('--adamig_version', default='1-3',
+                        help='ADaMIG version used to find the codelists of --variables in a CT diff. Defaults to 1-3.')
+    parser.add_argument('--output', help='Write the changes to a CSV file (use a .json extension for JSON)')
+    parser.add_argument('--offline', metavar='SNAPSHOT', help='Serve all metadata from a snapshot archive instead of the API')
+    _add_connection_arguments(parser)
+    args = parser.parse_args(argv)
+
+    variables = collect_variables(args.variables, args.from_file)
+
+    retriever = _retriever_from_args(args, offline=args.offline)
+    adamig_pattern = re.compile(r"^\d+[-.]\d+$")
+    if adamig_pattern.match(args.old) and adamig_pattern.match(args.new):
+        old_index, new_index = retriever._executor.map(retriever.get_variable_index, [args.old, args.new])
+        if not old_index or not new_index:
+            sys.exit(1)
+        for adam_variable in variables:
+            if not old_index.lookup(adam_variable) and not new_index.lookup(adam_variable):
+                print(f"Warning: {adam_variable} is in neither ADaMIG {args.old} nor {args.new}.")
+        changes = old_index.diff(new_index, variables=variables or None)
+    elif not adamig_pattern.match(args.old) and not adamig_pattern.match(args.new):
+        old_spec, new_spec = retriever.resolve_ct_package_spec(args.old), retriever.resolve_ct_package_spec(args.new)
+        if not old_spec or not new_spec:
+            print(f"ERROR: Could not resolve CT package {args.old if not old_spec else args.new}.")
+            sys.exit(1)
+        if old_spec[0] != new_spec[0]:
+            parser.error(f"cannot compare {old_spec[0]} with {new_spec[0]}")
+        old_package, new_package = retriever._executor.map(lambda spec: retriever.get_ct_package(*spec), [old_spec, new_spec])
+        if not old_package or not new_package:
+            sys.exit(1)
+
+        codelist_codes = None
+        if variables:
+            # Restrict to the codelists the variables reference in this standard
+            codelist_codes = set()
+            for adam_variable in variables:
+                details = retriever.get_variable_details(adam_variable, args.adamig_version, include_codelists=False)
+                if not details:
+                    print(f"Warning: {adam_variable} was not found in ADaMIG {args.adamig_version}; ignoring it.")
+                    continue
+                codes = {cl_id for cl_id, standard, href in retriever.codelist_references(details) if standard == old_spec[0]}
+                if not codes:
+                    print(f"Warning: {adam_variable} uses no {old_spec[0]} codelists; ignoring it.")
+                codelist_codes.update(codes)
+            if not codelist_codes:
+                print(f"ERROR: None of the given variables use {old_spec[0]} codelists; nothing to compare.")
+                sys.exit(1)
+        changes = old_package.diff(new_package, codelist_codes=codelist_codes)
+    else:
+        parser.error("compare two CT packages or two ADaMIG versions, not one of each")
+
+    print("\n" + format_table(changes, "No differences found."))
+    if args.output:
+        if args.output.lower().endswith(".json"):
+            with open(args.output, 'w', encoding='utf-8') as f:
+                json.dump(changes, f, indent=2)
+        else:
+            with open(args.output, 'w', newline='', encoding='utf-8') as f:
+                writer = csv.DictWriter(f, fieldnames=list(changes[0]) if changes else ["Change"])
+                writer.writeheader()
+                writer.writerows(changes)
+        print(f"\nChanges saved to {args.output}")
+    print(f"\n{len(changes)} change(s) between {args.old} and {args.new}.")
+
+def search_main(argv):
+    """Find variables by codelist or label/notes text, and codelists by term."""
+    from adam_search import SearchIndex
+
+    parser = argparse.ArgumentParser(prog='adam_genius.py search',
+                                     description='Reverse lookups: variables using a codelist, codelists containing a '
+                                                 'term, and variables whose label or notes mention some words')
+    parser.add_argument('text', nargs='*', help='Words to look for in variable labels and CDISC notes (e.g., baseline)')
+    parser.add_argument('--codelist', action='append', metavar='CODELIST',
+                        help='List the variables using this codelist, by C-code or submission value (repeatable)')
+    parser.add_argument('--term', action='append', metavar='TERM',
+                        help='List the codelists containing this term, by submission value, decoded value or C-code (repeatable)')
+    parser.add_argument('--adamig_version', default='1-3', help='ADaMIG version to search. Defaults to 1-3.')
+    parser.add_argument('--ct', action='append', metavar='PACKAGE',
+                        help='CT package to search, as standard-YYYY-MM-DD or a bare standard (repeatable). '
+                             'adamct and sdtmct default to their latest release.')
+    parser.add_argument('--limit', type=_positive_int, default=20, help='Maximum number of text matches (default: 20)')
+    parser.add_argument('--format', choices=['text', 'json'], default='text', help='Output format (default: text)')
+    parser.add_argument('--offline', metavar='SNAPSHOT', help='Serve all metadata from a snapshot archive instead of the API')
+    _add_connection_arguments(parser)
+    args = parser.parse_args(argv)
+    if not (args.text or args.codelist or args.term):
+        parser.error("give search text, --codelist or --term")
+
+    with redirect_stdout(sys.stderr if args.format == 'json' else sys.stdout):
+        retriever = _retriever_from_args(args, offline=args.offline)
+        ct_versions = {}
+        for spec in args.ct or []:
+            resolved = retriever.resolve_ct_package_spec(spec)
+            if not resolved:
+                print(f"ERROR: Could not resolve CT package {spec}.")
+                sys.exit(1)
+            ct_versions[resolved[0]] = resolved[1]
+        index = SearchIndex.build(retriever, args.adamig_version, ct_versions=ct_versions)
+        if not index:
+            print(f"ERROR: Could not load ADaMIG {args.adamig_version}.")
+            sys.exit(1)
+
+    results = {}
+    for codelist in args.codelist or []:
+        if not index.codelist_codes(codelist):
+            print(f"Warning: Codelist {codelist} is not a C-code and no codelist has that submission value in "
+                  f"{', '.join(index.ct_packages) or 'the loaded CT packages'}; pass --ct for its standard or use the C-code.",
+                  file=sys.stderr if args.format == 'json' else sys.stdout)
+        results[f"Variables using codelist {codelist}"] = index.variables_for_codelist(codelist)
+    for term in args.term or []:
+        results[f"Codelists containing term {term}"] = index.codelists_for_term(term)
+    if args.text:
+        query = " ".join(args.text)
+        results[f'Variables matching "{query}"'] = index.search_text(query, limit=args.limit)
+
+    if args.format == 'json':
+        print(json.dumps(results, indent=2))
+        return
+    for title, rows in results.items():
+        print(f"\n{title}:")
+        print(format_table(rows, "No matches."))
+
+# Commands selected by the first argument; anything else is a variable lookup
+SUBCOMMANDS = {
+    "snapshot": snapshot_main,
+    "warm-up": warm_up_main,
+    "export": export_main,
+    "validate": validate_main,
+    "diff": diff_main,
+    "search": search_main,
+}
+
+def main():
+    """Main function to run from command line."""
+    argv = sys.argv[1:]
+    command = lookup_main
+    if argv and argv[0] in SUBCOMMANDS:
+        command, argv = SUBCOMMANDS[argv[0]], argv[1:]
+
+    try:
+        command(argv)
     except KeyboardInterrupt:
         print("\nOperation cancelled by user")
         sys.exit(0)
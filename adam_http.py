@@ -0,0 +1,141 @@
+import random
+import threading
+import time
+from concurrent.futures import Future
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from adam_trace import tracer
+
+
+class TokenBucket:
+    """Thread-safe token bucket that limits the request rate to the CDISC Library API."""
+
+    def __init__(self, rate, capacity=None):
+        """Allow `rate` requests per second on average, with bursts of up to `capacity`."""
+        if rate <= 0:
+            raise ValueError(f"Rate limit must be positive, got {rate}")
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1.0, rate))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a request may be sent."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                # Refill for the time elapsed since the last call
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def create_session(pool_size):
+    """Create a requests.Session whose connection pool keeps `pool_size` keep-alive connections per host."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+# Transient statuses worth retrying: rate limited, or the server/gateway is struggling
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+def backoff_delay(attempt, retry_after=None, base=0.5, cap=30.0):
+    """
+    Seconds to wait before retry number `attempt` (0-based).
+
+    Uses full-jitter exponential backoff, but never less than the server's
+    Retry-After header (delta-seconds or an HTTP date) when one is given. The
+    result never exceeds cap, so a server cannot stall a worker indefinitely.
+    """
+    delay = random.uniform(0, min(cap, base * (2 ** attempt)))
+    if retry_after:
+        try:
+            delay = max(delay, float(retry_after))
+        except ValueError:
+            try:
+                delay = max(delay, parsedate_to_datetime(retry_after).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass # Unparseable header; keep the jittered delay
+    return min(delay, cap)
+
+
+@tracer.traced("http.get", "url")
+def get_with_retries(session, url, headers, rate_limiter=None, max_retries=4, timeout=None, stream=False):
+    """
+    GET a URL, retrying connection errors, timeouts and RETRY_STATUSES with backoff.
+
+    Returns the final response (which may still be an error status once retries
+    are exhausted); re-raises the last connection error if every attempt failed.
+    With stream=True the body is left unread for the caller to consume.
+    """
+    if max_retries < 0:
+        raise ValueError(f"max_retries must not be negative, got {max_retries}")
+    span = tracer.current()
+    for attempt in range(max_retries + 1):
+        span["retries"] = attempt
+        if rate_limiter:
+            rate_limiter.acquire()
+        try:
+            response = session.get(url, headers=headers, timeout=timeout, stream=stream)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            if attempt == max_retries:
+                raise
+            delay = backoff_delay(attempt)
+            print(f"Warning: Request to {url} failed ({e}); retrying in {delay:.1f}s...")
+            time.sleep(delay)
+            continue
+
+        if response.status_code not in RETRY_STATUSES or attempt == max_retries:
+            span["status"] = response.status_code
+            if stream:
+                span["bytes"] = int(response.headers.get("Content-Length") or 0) # Bytes on the wire
+            else:
+                span["bytes"] = len(response.content)
+            return response
+        delay = backoff_delay(attempt, response.headers.get("Retry-After"))
+        print(f"Warning: {url} returned HTTP {response.status_code}; retrying in {delay:.1f}s "
+              f"(attempt {attempt + 1} of {max_retries})...")
+        response.close()
+        time.sleep(delay)
+
+
+class InFlightRequests:
+    """Coalesce concurrent calls for the same key so they share one call and its result."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {} # key -> Future of the call currently in flight
+
+    def run(self, key, fn):
+        """Call fn() unless a call for key is already running, in which case wait for its result."""
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
@@ -0,0 +1,132 @@
+import math
+import re
+
+from adam_genius import DEFAULT_CT_STANDARDS, ADaMIGVariableIndex
+
+
+class SearchIndex:
+    """
+    Reverse lookups over one ADaMIG version and its CT packages.
+
+    Built once from the variable details and codelists, it answers from in-memory
+    inverted indexes:
+
+        codelist -> variables   which variables use C66781 (or its submission value)
+        term -> codelists       which codelists contain the term HOURS
+        text -> variables       which variables mention "baseline" in their label or notes
+
+    Build it with build(); every query is a few dictionary lookups.
+    """
+
+    # Label words count more than words from the CDISC notes when ranking text matches
+    LABEL_WEIGHT = 3.0
+    NOTES_WEIGHT = 1.0
+
+    def __init__(self, variable_details, ct_packages):
+        """variable_details: details dicts (as from iter_ig_variables); ct_packages: CTPackage objects."""
+        self.variables = {} # (Dataset, NAME) -> {"Dataset", "Variable", "Label"}
+        self.codelist_variables = {} # C-code -> [(Dataset, NAME), ...]
+        self.text_postings = {} # word -> {(Dataset, NAME): weight}
+        self.term_codelists = {} # Upper-cased submission value, decoded value or term C-code -> [term entry]
+        self.codelist_aliases = {} # Upper-cased codelist submission value -> C-codes
+        self.ct_packages = [f"{package.standard}-{package.ct_version}" for package in ct_packages]
+
+        for details in variable_details:
+            key = (details["Dataset"], details["Variable"].upper())
+            self.variables[key] = {"Dataset": details["Dataset"], "Variable": details["Variable"],
+                                   "Label": details.get("Label") or ""}
+            for href in details.get("CodelistLinks", []):
+                code = href.rstrip("/").split("/")[-1].upper()
+                postings = self.codelist_variables.setdefault(code, [])
+                if key not in postings:
+                    postings.append(key)
+            for text, weight in ((details.get("Label"), self.LABEL_WEIGHT), (details.get("CDISCNotes"), self.NOTES_WEIGHT)):
+                for word in self.tokenize(text or ""):
+                    postings = self.text_postings.setdefault(word, {})
+                    postings[key] = max(postings.get(key, 0.0), weight)
+
+        for package in ct_packages:
+            for cl_info in package.iter_codelists():
+                code = cl_info["CodelistCode"].upper()
+                if cl_info["ID"]:
+                    aliases = self.codelist_aliases.setdefault(cl_info["ID"].upper(), [])
+                    if code not in aliases:
+                        aliases.append(code)
+                for term in cl_info["Terms"]:
+                    entry = {
+                        "Standard": cl_info["Standard"], "Version": cl_info["Version"],
+                        "CodelistCode": cl_info["CodelistCode"], "CodelistID": cl_info["ID"],
+                        "CodelistName": cl_info["Name"], "ExtensibleYN": cl_info["ExtensibleYN"],
+                        "TermCode": term["TermCode"], "TERM": term["TERM"], "TermDecodedValue": term["TermDecodedValue"],
+                    }
+                    for value in {value.upper() for value in (term["TERM"], term["TermDecodedValue"], term["TermCode"]) if value}:
+                        self.term_codelists.setdefault(value, []).append(entry)
+
+    @classmethod
+    def build(cls, retriever, adamig_version, ct_versions=None):
+        """
+        Build the index for an ADaMIG version using a retriever's caches.
+
+        ct_versions maps standard -> CT version; adamct and sdtmct default to their
+        latest releases. Returns None if the ADaMIG version cannot be loaded.
+        """
+        ct_versions = dict(ct_versions or {})
+        for standard in DEFAULT_CT_STANDARDS:
+            if standard not in ct_versions:
+                ct_versions[standard] = retriever.get_latest_ct_version_for_standard(standard)
+        details = list(retriever.iter_ig_variables(adamig_version, ct_versions=ct_versions))
+        if not details:
+            return None
+        packages = [retriever.get_ct_package(standard, ct_version)
+                    for standard, ct_version in sorted(ct_versions.items()) if ct_version]
+        return cls(details, [package for package in packages if package])
+
+    @staticmethod
+    def tokenize(text):
+        """Lower-cased words of a label or note, without stopwords."""
+        return [word for word in re.findall(r"[a-z0-9]+", text.lower()) if word not in ADaMIGVariableIndex.LABEL_STOPWORDS]
+
+    def codelist_codes(self, codelist):
+        """
+        C-codes a codelist reference stands for: itself if it is a C-code (C66742), otherwise
+        the codelists with that submission value (NY) in the indexed CT packages. An empty
+        list means the submission value is not in any of them.
+        """
+        key = codelist.strip().upper()
+        if re.match(r"^C\d+$", key) or key in self.codelist_variables:
+            return [key]
+        return list(self.codelist_aliases.get(key, []))
+
+    def variables_for_codelist(self, codelist):
+        """Variables referencing a codelist, given as a C-code (C66742) or submission value (NY)."""
+        return [dict(self.variables[variable], CodelistCode=code)
+                for code in self.codelist_codes(codelist) for variable in self.codelist_variables.get(code, [])]
+
+    def codelists_for_term(self, term):
+        """Codelists containing a term, matched on its submission value, decoded value or C-code (case-insensitive)."""
+        return [dict(entry) for entry in self.term_codelists.get(term.strip().upper(), [])]
+
+    def search_text(self, query, limit=20):
+        """
+        Variables whose label or CDISC notes contain the query words, best first.
+
+        Each word is weighted by its rarity (IDF) and by where it occurs (label over
+        notes); variables matching more of the query rank higher.
+        """
+        if limit < 1:
+            raise ValueError(f"limit must be at least 1, got {limit}")
+        words = set(self.tokenize(query))
+        scores = {}
+        matched = {}
+        for word in words:
+            postings = self.text_postings.get(word, {})
+            if not postings:
+                continue
+            idf = math.log(1 + len(self.variables) / len(postings))
+            for key, weight in postings.items():
+                scores[key] = scores.get(key, 0.0) + idf * weight
+                matched[key] = matched.get(key, 0) + 1
+
+        ranked = sorted(scores, key=lambda key: (matched[key], scores[key]), reverse=True)[:limit]
+        return [dict(self.variables[key], Score=round(scores[key], 2), Matched=f"{matched[key]}/{len(words)}")
+                for key in ranked]
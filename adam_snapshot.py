@@ -0,0 +1,63 @@
+import json
+import zipfile
+from datetime import datetime
+
+
+class Snapshot:
+    """
+    Read-only offline copy of CDISC Library responses stored in a zip archive.
+
+    Each API path (e.g., /mdr/adam/adamig-1-3) is stored as a deflated JSON member
+    (mdr/adam/adamig-1-3.json), plus a manifest.json describing the contents.
+    """
+
+    MANIFEST = "manifest.json"
+
+    def __init__(self, path):
+        """Open an existing snapshot archive."""
+        self.path = path
+        self._zip = zipfile.ZipFile(path, "r")
+        self.manifest = json.loads(self._zip.read(self.MANIFEST))
+        self._members = set(self._zip.namelist())
+
+    @staticmethod
+    def member_name(api_path):
+        """Map an API path to its archive member name."""
+        return api_path.strip("/") + ".json"
+
+    def get(self, api_path):
+        """Return the raw JSON body stored for an API path, or None if it is not in the snapshot."""
+        name = self.member_name(api_path)
+        if name not in self._members:
+            return None
+        return self._zip.read(name)
+
+    def close(self):
+        self._zip.close()
+
+    @classmethod
+    def write(cls, path, responses, adamig_versions, ct_packages, base_url):
+        """
+        Write a snapshot archive.
+
+        responses maps API paths to decoded JSON documents. A Terminology listing that
+        names only the included CT packages is added, so "latest version" lookups
+        resolve within the snapshot.
+        """
+        responses = dict(responses)
+        responses["/mdr/products/Terminology"] = {
+            "_links": {"packages": [{"href": f"/mdr/ct/packages/{package}"} for package in ct_packages]}
+        }
+        manifest = {
+            "created": datetime.now().isoformat(timespec="seconds"),
+            "base_url": base_url,
+            "adamig_versions": list(adamig_versions),
+            "ct_packages": list(ct_packages),
+            "paths": sorted(responses),
+        }
+
+        with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=9) as archive:
+            archive.writestr(cls.MANIFEST, json.dumps(manifest, indent=2))
+            for api_path, data in responses.items():
+                archive.writestr(cls.member_name(api_path), json.dumps(data, separators=(",", ":")))
+        return manifest
@@ -0,0 +1,200 @@
+import functools
+import importlib
+import inspect
+import itertools
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Tracer:
+    """
+    Timing spans for the stages of a lookup: API requests, JSON decoding, ADaMIG
+    and CT lookups, and LLM calls.
+
+    Spans are only recorded while the tracer is enabled (e.g., with --profile) or an
+    exporter is registered, so instrumentation costs next to nothing otherwise. A
+    finished span is a dict with name, span_id, parent_id (the enclosing span on the
+    same thread), thread, start (epoch seconds), duration_ms and the attributes the
+    instrumented code set on it (bytes, cache, retries, ...).
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self._spans = []
+        self._exporters = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._ids = itertools.count(1)
+
+    @property
+    def active(self):
+        return self.enabled or bool(self._exporters)
+
+    def add_exporter(self, exporter):
+        """Call exporter(span) for every finished span, e.g., to forward it to a metrics or tracing backend."""
+        with self._lock:
+            self._exporters.append(exporter)
+
+    def remove_exporter(self, exporter):
+        with self._lock:
+            self._exporters.remove(exporter)
+
+    @contextmanager
+    def span(self, name, **attributes):
+        """
+        Time the enclosed block as a span; yields the attribute dict so the block can add to it.
+
+            with tracer.span("api.request", path=path) as span:
+                span["bytes"] = len(body)
+        """
+        if not self.active:
+            yield attributes
+            return
+
+        stack = self._local.__dict__.setdefault("stack", [])
+        span_id = next(self._ids)
+        parent_id = stack[-1][0] if stack else None
+        stack.append((span_id, attributes))
+        start = time.time()
+        started = time.perf_counter()
+        try:
+            yield attributes
+        except BaseException as e:
+            attributes["error"] = type(e).__name__
+            raise
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            stack.pop()
+            self._finish({
+                "name": name, "span_id": span_id, "parent_id": parent_id,
+                "thread": threading.current_thread().name, "start": start,
+                "duration_ms": round(duration_ms, 3), **attributes,
+            })
+
+    def traced(self, name, *argument_names, **renamed_arguments):
+        """
+        Decorator recording every call of a function as a span.
+
+        The named arguments become span attributes (renamed_arguments maps an attribute
+        name to the argument it records); the function can add more through current().
+
+            @tracer.traced("ct.package", "standard", version="ct_version")
+            def _build_ct_package(self, standard, ct_version): ...
+        """
+        def decorate(fn):
+            signature = inspect.signature(fn)
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if not self.active:
+                    return fn(*args, **kwargs)
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                attributes = {argument: bound.arguments[argument] for argument in argument_names}
+                attributes.update((attribute, bound.arguments[argument]) for attribute, argument in renamed_arguments.items())
+                with self.span(name, **attributes):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorate
+
+    def current(self):
+        """Attributes of the innermost open span on this thread (a throwaway dict when there is none)."""
+        stack = getattr(self._local, "stack", None)
+        return stack[-1][1] if stack else {}
+
+    def _finish(self, span):
+        with self._lock:
+            if self.enabled:
+                self._spans.append(span)
+            exporters = list(self._exporters)
+        for exporter in exporters:
+            try:
+                exporter(span)
+            except Exception as e:
+                print(f"Warning: Span exporter {exporter!r} failed: {e}", file=sys.stderr)
+
+    def spans(self):
+        """Finished spans recorded while enabled, in completion order."""
+        with self._lock:
+            return list(self._spans)
+
+    def clear(self):
+        with self._lock:
+            self._spans.clear()
+
+    def summary(self):
+        """
+        Aggregate recorded spans per name.
+
+        Returns rows with Stage, Calls, Total ms, Mean ms, Max ms, Bytes, Cache
+        (counts of each cache outcome, e.g., "hit=3 miss=1") and Retries, slowest first.
+        """
+        stages = {}
+        for span in self.spans():
+            stage = stages.setdefault(span["name"], {"Stage": span["name"], "Calls": 0, "Total ms": 0.0, "Max ms": 0.0,
+                                                     "Bytes": 0, "Cache": {}, "Retries": 0})
+            stage["Calls"] += 1
+            stage["Total ms"] += span["duration_ms"]
+            stage["Max ms"] = max(stage["Max ms"], span["duration_ms"])
+            stage["Bytes"] += span.get("bytes") or 0
+            stage["Retries"] += span.get("retries") or 0
+            if span.get("cache"):
+                stage["Cache"][span["cache"]] = stage["Cache"].get(span["cache"], 0) + 1
+
+        rows = []
+        for stage in sorted(stages.values(), key=lambda stage: stage["Total ms"], reverse=True):
+            rows.append({
+                **stage,
+                "Total ms": round(stage["Total ms"], 1),
+                "Mean ms": round(stage["Total ms"] / stage["Calls"], 1),
+                "Max ms": round(stage["Max ms"], 1),
+                "Cache": " ".join(f"{outcome}={count}" for outcome, count in sorted(stage["Cache"].items())),
+            })
+        return rows
+
+    def format_summary(self):
+        """Format summary() as a plain-text table."""
+        rows = self.summary()
+        if not rows:
+            return "No spans recorded."
+        line = "{:<22} {:>6} {:>10} {:>9} {:>9} {:>11} {:>7}  {}"
+        lines = [line.format("Stage", "Calls", "Total ms", "Mean ms", "Max ms", "Bytes", "Retries", "Cache")]
+        lines.append("-" * 90)
+        for row in rows:
+            lines.append(line.format(row["Stage"], row["Calls"], row["Total ms"], row["Mean ms"], row["Max ms"],
+                                     row["Bytes"], row["Retries"], row["Cache"]))
+        return "\n".join(lines)
+
+    def write_json(self, path):
+        """Dump the recorded spans and their summary to a JSON file."""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"summary": self.summary(), "spans": self.spans()}, f, indent=2, default=str)
+
+
+def jsonl_exporter(path):
+    """Exporter appending each span as a JSON line to path (for log shippers and collectors)."""
+    lock = threading.Lock()
+
+    def export(span):
+        line = json.dumps(span, default=str)
+        with lock, open(path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+    return export
+
+
+def load_exporter(spec):
+    """Import an exporter given as "module:callable"; the callable is called with no arguments to build it."""
+    module_name, _, attribute = spec.partition(":")
+    return getattr(importlib.import_module(module_name), attribute)()
+
+
+# Process-wide tracer used by the retriever, the HTTP helpers and adamai
+tracer = Tracer()
+
+# ADAM_GENIUS_TRACE_EXPORTER="package.module:factory" forwards every span, e.g., from a Streamlit deployment
+if os.getenv("ADAM_GENIUS_TRACE_EXPORTER"):
+    tracer.add_exporter(load_exporter(os.environ["ADAM_GENIUS_TRACE_EXPORTER"]))
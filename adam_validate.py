@@ -0,0 +1,209 @@
+import os
+import re
+from itertools import chain
+
+import pandas as pd
+from pandas.api.types import is_numeric_dtype
+
+from adam_genius import ADaMMetadataRetriever
+
+
+class DatasetValidator:
+    """
+    Check ADaM datasets (SAS7BDAT, XPT, Parquet or CSV) against ADaMIG metadata and CT.
+
+    Three checks are run:
+
+        presence   variables of the data structure missing from the dataset
+                   (ERROR for Req, WARNING for Cond; Perm variables are optional)
+        datatype   columns whose type contradicts the IG simpleDatatype
+        codelist   values outside a non-extensible codelist
+
+    Files are read in chunks, and codelist membership is tested with a vectorized
+    isin against term sets built once per variable, so multi-million-row
+    datasets validate without being loaded whole.
+    """
+
+    DEFAULT_CHUNKSIZE = 250000
+    # Distinct offending values kept per issue
+    MAX_EXAMPLES = 10
+
+    NUMERIC_DATATYPES = {"num", "integer", "float", "decimal", "double"}
+    CHARACTER_DATATYPES = {"char", "text", "string"}
+
+    def __init__(self, retriever=None, adamig_version="1-3", ct_versions=None):
+        """ct_versions maps standard -> CT version; other standards use their latest release."""
+        self.retriever = retriever or ADaMMetadataRetriever()
+        self.adamig_version = adamig_version.replace(".", "-")
+        self.ct_versions = dict(ct_versions or {})
+        self._structures = {} # Data structure -> {NAME: details}
+        self._term_sets = {} # Variable NAME -> frozenset of allowed values, or None when unchecked
+
+    @staticmethod
+    def iter_chunks(path, chunksize=DEFAULT_CHUNKSIZE):
+        """Yield a file's rows as DataFrames of at most chunksize rows."""
+        extension = os.path.splitext(path)[1].lower()
+        if extension == ".csv":
+            yield from pd.read_csv(path, chunksize=chunksize, keep_default_na=False, na_values=[""])
+        elif extension in (".sas7bdat", ".xpt"):
+            # SAS7BDAT records its encoding in the header; transport files are Latin-1 at most
+            sas_format = "sas7bdat" if extension == ".sas7bdat" else "xport"
+            encoding = "infer" if sas_format == "sas7bdat" else "latin-1"
+            with pd.read_sas(path, format=sas_format, encoding=encoding, chunksize=chunksize) as reader:
+                yield from reader
+        elif extension == ".parquet":
+            import pyarrow.parquet as pq # Optional dependency, needed only for Parquet datasets
+            for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+                yield batch.to_pandas()
+        else:
+            raise ValueError(f"Unsupported dataset format: {path} (expected .sas7bdat, .xpt, .parquet or .csv)")
+
+    @staticmethod
+    def guess_structure(dataset_name, columns):
+        """ADaMIG data structure for a dataset: ADSL by name, BDS if it has PARAMCD, otherwise None."""
+        if dataset_name.upper() == "ADSL":
+            return "ADSL"
+        if "PARAMCD" in columns:
+            return "BDS"
+        return None
+
+    def structure_metadata(self, structure):
+        """Details (with codelists) of every variable in an ADaMIG data structure, keyed by NAME."""
+        if structure not in self._structures:
+            self._structures[structure] = {
+                details["Variable"].upper(): details
+                for details in self.retriever.iter_ig_variables(self.adamig_version, ct_versions=self.ct_versions,
+                                                                datasets=[structure])
+            }
+        return self._structures[structure]
+
+    def _column_metadata(self, column, structure):
+        """Details for a dataset column, resolving numbered names (TRT01P -> TRTxxP); None if not in the IG."""
+        index = self.retriever.get_variable_index(self.adamig_version)
+        entries = index.lookup(column) if index else []
+        if not entries:
+            return None
+        if structure:
+            for entry in entries:
+                if entry["Dataset"].upper() == structure:
+                    return self.structure_metadata(structure).get(entry["Variable"]["name"].upper())
+        # Defined in another data structure; its datatype and codelists still apply
+        return self.retriever.get_variable_details(column, self.adamig_version, ct_versions=self.ct_versions)
+
+    def _term_set(self, details):
+        """Allowed values of a variable whose codelists are all non-extensible, or None."""
+        name = details["Variable"].upper()
+        if name not in self._term_sets:
+            codelists = details.get("Codelists") or []
+            if codelists and all(cl.get("ExtensibleYN") == "No" for cl in codelists):
+                self._term_sets[name] = frozenset(term["TERM"] for cl in codelists for term in cl["Terms"])
+            else:
+                self._term_sets[name] = None
+        return self._term_sets[name]
+
+    def validate(self, path, structure=None, chunksize=DEFAULT_CHUNKSIZE):
+        """
+        Validate one dataset file and return a list of issues.
+
+        Each issue is a dict with Dataset, Variable, Severity (ERROR, WARNING or INFO),
+        Check, Message, Rows (offending row count, where applicable) and Examples.
+        structure defaults to guess_structure; when unknown, presence is not checked.
+        """
+        dataset_name = os.path.splitext(os.path.basename(path))[0].upper()
+        typed = not path.lower().endswith(".csv") # CSV cannot tell "001" from 1
+        issues = []
+
+        def issue(variable, severity, check, message, rows=None, examples=None):
+            issues.append({"Dataset": dataset_name, "Variable": variable, "Severity": severity, "Check": check,
+                           "Message": message, "Rows": rows, "Examples": examples or []})
+
+        chunks = self.iter_chunks(path, chunksize)
+        first = next(chunks, None)
+        if first is None:
+            issue("", "ERROR", "read", "Dataset is empty or unreadable.")
+            return issues
+        columns = [column.upper() for column in first.columns]
+        structure = (structure or self.guess_structure(dataset_name, columns) or "").upper() or None
+
+        # Resolve every column's metadata and term set once, before reading any further rows
+        checks = {} # Column -> (details, term set)
+        for original, column in zip(first.columns, columns):
+            details = self._column_metadata(column, structure)
+            if details is None:
+                issue(column, "INFO", "presence", f"{column} is not defined in ADaMIG {self.adamig_version}.")
+            else:
+                checks[original] = (details, self._term_set(details))
+
+        if structure:
+            for details in self.structure_metadata(structure).values():
+                # Lower-case placeholders stand for digits, so TRTxxP is satisfied by TRT01P
+                pattern = re.compile("^" + re.sub(r"[a-z]", r"\\d", details["Variable"]) + "$")
+                if any(pattern.match(column) for column in columns):
+                    continue
+                if details.get("Core") == "Req":
+                    issue(details["Variable"], "ERROR", "presence",
+                          f"Required {structure} variable {details['Variable']} is missing.")
+                elif details.get("Core") == "Cond":
+                    issue(details["Variable"], "WARNING", "presence",
+                          f"Conditionally required {structure} variable {details['Variable']} is missing; "
+                          "check whether its condition applies.")
+
+        invalid_rows = {} # Column -> offending row count
+        invalid_values = {} # Column -> distinct offending values (capped)
+        type_errors = {} # Column -> message
+        row_count = 0
+        for chunk in chain([first], chunks):
+            row_count += len(chunk)
+            for original, (details, terms) in checks.items():
+                series = chunk[original]
+                datatype = (details.get("DataType") or "").lower()
+                has_values = series.notna().any()
+                if original not in type_errors and has_values:
+                    numeric = is_numeric_dtype(series)
+                    if datatype in self.NUMERIC_DATATYPES and not numeric:
+                        type_errors[original] = f"{original} should be numeric ({details['DataType']}) but holds text."
+                    elif datatype in self.CHARACTER_DATATYPES and numeric and typed:
+                        type_errors[original] = f"{original} should be character ({details['DataType']}) but is numeric."
+
+                if terms is None or not has_values:
+                    continue
+                values = series.dropna()
+                if not is_numeric_dtype(values):
+                    values = values.astype(str).str.strip()
+                    values = values[values != ""]
+                elif (values % 1 == 0).all():
+                    values = values.astype("int64").astype(str) # Numeric codes: 1.0 -> "1"
+                else:
+                    values = values.astype(str)
+                invalid = values[~values.isin(terms)]
+                if len(invalid):
+                    invalid_rows[original] = invalid_rows.get(original, 0) + len(invalid)
+                    seen = invalid_values.setdefault(original, [])
+                    for value in invalid.unique()[:self.MAX_EXAMPLES]:
+                        if value not in seen and len(seen) < self.MAX_EXAMPLES:
+                            seen.append(value)
+
+        for original, message in type_errors.items():
+            issue(original.upper(), "ERROR", "datatype", message)
+        for original, rows in invalid_rows.items():
+            details = checks[original][0]
+            codelist_ids = ", ".join(cl["ID"] for cl in details["Codelists"])
+            issue(original.upper(), "ERROR", "codelist",
+                  f"{rows} of {row_count} rows have values outside non-extensible codelist {codelist_ids}.",
+                  rows=rows, examples=invalid_values[original])
+        return issues
+
+
+def format_issues(issues):
+    """Format validation issues as a plain-text table."""
+    if not issues:
+        return "No issues found."
+    lines = ["{:<10} {:<10} {:<8} {:<10} {}".format("Dataset", "Variable", "Severity", "Check", "Message")]
+    lines.append("-" * 90)
+    for item in issues:
+        message = item["Message"]
+        if item["Examples"]:
+            message += " e.g. " + ", ".join(repr(value) for value in item["Examples"])
+        lines.append("{:<10} {:<10} {:<8} {:<10} {}".format(item["Dataset"], item["Variable"], item["Severity"],
+                                                           item["Check"], message))
+    return "\n".join(lines)
@@ -1,16 +1,33 @@
 import os
 import sys
 import re
-import subprocess
+import time
 from dotenv import load_dotenv
 from openai import OpenAI
 
+from adam_cache import AnswerCache
+from adam_genius import ADaMMetadataRetriever, enable_profiling
+from adam_trace import tracer
+
 # Load environment variables
 load_dotenv()
 
 # Initialize OpenAI client
 client = OpenAI(api_key=os.getenv('OPENAI_API_KEY'))
 
+# Model used for both variable extraction and explanations
+MODEL = "gpt-4o-mini"
+
+# Repeated questions are answered from memory. The metadata in the key carries the
+# ADaMIG/CT versions, so a new release never serves a stale answer. Both caches match
+# the normalized wording exactly: "label of TRT01P" and "core of TRT01P", or "TRT01P
+# in ADSL" and "TRT01A in ADSL", differ in exactly the word that decides the answer.
+answer_cache = AnswerCache()
+extraction_cache = AnswerCache()
+
+# Approximate token budget for the metadata pasted into the LLM prompt
+PROMPT_TOKEN_BUDGET = int(os.getenv('ADAM_GENIUS_PROMPT_TOKENS', '1500'))
+
 def extract_adam_variable(query):
     """
     Use GPT to extract ADaM variable from natural language query
@@ -21,19 +38,26 @@ def extract_adam_variable(query):
     Returns:
         str: Extracted ADaM variable name
     """
+    cached = extraction_cache.get(None, query, None, MODEL)
+    if cached:
+        return cached
+
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": "You are an expert in extracting ADaM variable names from natural language queries. Always return ONLY the variable name in uppercase."},
-                {"role": "user", "content": f"Extract the ADaM variable name from this query: {query}"}
-            ],
-            max_tokens=10
-        )
+        with tracer.span("llm.extract_variable", model=MODEL) as span:
+            response = client.chat.completions.create(
+                model=MODEL,
+                messages=[
+                    {"role": "system", "content": "You are an expert in extracting ADaM variable names from natural language queries. Always return ONLY the variable name in uppercase."},
+                    {"role": "user", "content": f"Extract the ADaM variable name from this query: {query}"}
+                ],
+                max_tokens=10
+            )
+            _record_usage(span, response)
         variable = response.choices[0].message.content.strip().upper()
         
-        # Validate variable (must be uppercase letters)
-        if re.match(r'^[A-Z]+$', variable):
+        # Validate variable (uppercase letters, then letters or digits, e.g. TRT01P)
+        if re.match(r'^[A-Z][A-Z0-9]*$', variable):
+            extraction_cache.put(None, query, None, MODEL, variable)
             return variable
         else:
             print(f"Could not extract a valid ADaM variable from: {query}")
@@ -43,6 +67,146 @@ def extract_adam_variable(query):
         print(f"Error extracting variable: {e}")
         return None
 
+def resolve_adam_variable(query, retriever, adamig_version="1-3"):
+    """
+    Find the ADaM variable a query is about, calling the LLM only when needed.
+    
+    A local pre-pass matches query tokens against the ADaMIG variable names and,
+    failing that, the query words against variable labels. extract_adam_variable
+    (an LLM round trip) is used only when that pass finds nothing or is ambiguous.
+    
+    Args:
+        query (str): Natural language query about an ADaM variable
+        retriever (ADaMMetadataRetriever): Retriever holding the ADaMIG variable index
+        adamig_version (str): ADaMIG version (e.g., 1-3)
+    
+    Returns:
+        str: ADaM variable name, or None if none could be identified
+    """
+    index = retriever.get_variable_index(adamig_version)
+    if index:
+        candidates = index.match_query(query)
+        if len(candidates) == 1:
+            return candidates[0]
+    return extract_adam_variable(query)
+
+def get_variable_metadata(variable, retriever=None, adamig_version="1-3", include_codelists=True):
+    """
+    Retrieve metadata for an ADaM variable in-process from the CDISC Library API.
+    
+    Args:
+        variable (str): ADaM variable name
+        retriever (ADaMMetadataRetriever): Long-lived retriever to reuse (and its caches);
+            a new one is created if omitted
+        adamig_version (str): ADaMIG version (e.g., 1-3)
+        include_codelists (bool): Fetch codelist terms too; if False, "Codelists" is left
+            empty for the caller to fill with retriever.iter_codelists
+    
+    Returns:
+        dict: Variable details as returned by ADaMMetadataRetriever.get_variable_details,
+            or None if the variable could not be found
+    """
+    retriever = retriever or ADaMMetadataRetriever()
+    return retriever.get_variable_details(variable, adamig_version, include_codelists=include_codelists)
+
+def estimate_tokens(text):
+    """Rough token count for English/JSON-like text (about 4 characters per token)."""
+    return (len(text) + 3) // 4
+
+def serialize_metadata_for_prompt(details, query="", max_tokens=PROMPT_TOKEN_BUDGET):
+    """
+    Build a compact, token-budgeted text view of variable metadata for the LLM.
+    
+    Variable attributes are always included (long CDISC notes are truncated to fit).
+    The remaining budget is shared between codelists; terms mentioned in the query are
+    listed first, and long term lists are cut off with a count of what was omitted.
+    
+    Args:
+        details (dict): Variable details from ADaMMetadataRetriever.get_variable_details
+        query (str): User's query, used to pick the relevant terms
+        max_tokens (int): Approximate token budget for the whole view
+    
+    Returns:
+        str: Compact metadata view
+    """
+    lines = [
+        f"Variable: {details.get('Dataset', 'N/A')}.{details.get('Variable', 'N/A')} (ADaMIG {details.get('ADaMIGVersion', 'N/A')})",
+        f"Label: {details.get('Label', 'N/A')}",
+        f"Type: {details.get('DataType', 'N/A')} | Core: {details.get('Core', 'N/A')}",
+    ]
+    if details.get('IGVariable') and details['IGVariable'] != details.get('Variable'):
+        lines.insert(1, f"IG variable: {details['IGVariable']} (numbered placeholder)")
+    notes = " ".join(str(details.get('CDISCNotes') or 'N/A').split())
+    notes_budget = max(0, max_tokens // 2 - estimate_tokens("\n".join(lines)))
+    if estimate_tokens(notes) > notes_budget:
+        notes = notes[:notes_budget * 4].rsplit(" ", 1)[0] + " ..."
+    lines.append(f"Notes: {notes}")
+
+    codelists = details.get("Codelists") or []
+    if not codelists:
+        lines.append("Codelists: none")
+        return "\n".join(lines)
+
+    query_upper = " ".join(query.upper().split())
+    query_words = set(re.findall(r"[A-Z0-9]+", query_upper))
+
+    def relevance(term):
+        # An exact submission value (e.g., "Y") outranks a decoded value quoted in the query
+        decoded = term.get("TermDecodedValue", "").upper()
+        return 2 * (term.get("TERM", "").upper() in query_words) + bool(decoded and decoded in query_upper)
+
+    remaining = max(0, max_tokens - estimate_tokens("\n".join(lines)))
+    for position, cl in enumerate(codelists):
+        # Budget left unused by earlier codelists rolls over to the later ones
+        share = remaining // (len(codelists) - position)
+        terms = cl.get("Terms") or []
+        extensible = "extensible" if cl.get("ExtensibleYN") == "Yes" else "non-extensible"
+        header = (f"Codelist {cl.get('ID', 'N/A')} - {cl.get('Name', 'N/A')} "
+                  f"({cl.get('CodelistCode', 'N/A')}, {cl.get('Standard', '')} {cl.get('Version', '')}, {extensible}): "
+                  f"{len(terms)} terms")
+        lines.append(header)
+        used = estimate_tokens(header)
+
+        # Terms the user asked about come first, then the rest in codelist order
+        ordered = sorted(terms, key=relevance, reverse=True)
+
+        shown = 0
+        for term in ordered:
+            line = f"  {term.get('TERM', '')} = {term.get('TermDecodedValue', '')}"
+            if used + estimate_tokens(line) > share:
+                break
+            lines.append(line)
+            used += estimate_tokens(line)
+            shown += 1
+        if shown < len(terms):
+            lines.append(f"  ... {len(terms) - shown} more terms omitted")
+            used += estimate_tokens(lines[-1])
+        remaining -= used
+
+    return "\n".join(lines)
+
+def _record_usage(span, response):
+    """Copy an OpenAI response's token usage onto a timing span."""
+    usage = getattr(response, "usage", None)
+    if usage:
+        span["prompt_tokens"] = usage.prompt_tokens
+        span["completion_tokens"] = usage.completion_tokens
+
+def _explanation_messages(variable, query, metadata):
+    """Chat messages asking the model to explain a variable's metadata."""
+    return [
+        {"role": "system", "content": (
+            "You are an expert in explaining ADaM variable metadata in a friendly, "
+            "conversational manner. Your task is to read the user query and the metadata, "
+            "and then generate a response based on the metadata you fetched for the variable." 
+        )},
+        {"role": "user", "content": (
+            f"Here is the user's query about the ADaM variable {variable}: '{query}'\n"
+            f"Here is the metadata for the variable {variable}: {metadata}\n"
+            "Based on this information, provide a clear, very short in 2 lines, easy-to-understand answer and provide actual full {metadata} for reference"
+        )}
+    ]
+
 def generate_natural_response(variable, query, metadata):
     """
     Use GPT to generate a conversational response based on metadata and the user query.
@@ -50,62 +214,111 @@ def generate_natural_response(variable, query, metadata):
     Args:
         variable (str): ADaM variable name
         query (str): User's query about the variable
-        metadata (str): Metadata retrieved for the variable
+        metadata (str): Metadata retrieved for the variable (see serialize_metadata_for_prompt)
     
     Returns:
         str: Conversational explanation
     """
+    cached = answer_cache.get(variable, query, metadata, MODEL)
+    if cached:
+        return cached
+
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {"role": "system", "content": (
-                    "You are an expert in explaining ADaM variable metadata in a friendly, "
-                    "conversational manner. Your task is to read the user query and the metadata, "
-                    "and then generate a response based on the metadata you fetched for the variable." 
-                )},
-                {"role": "user", "content": (
-                    f"Here is the user's query about the ADaM variable {variable}: '{query}'\n"
-                    f"Here is the metadata for the variable {variable}: {metadata}\n"
-                    "Based on this information, provide a clear, very short in 2 lines, easy-to-understand answer and provide actual full {metadata} for reference"
-                )}
-            ]
-        )
-        return response.choices[0].message.content.strip()
+        with tracer.span("llm.explain", model=MODEL) as span:
+            response = client.chat.completions.create(
+                model=MODEL,
+                messages=_explanation_messages(variable, query, metadata)
+            )
+            _record_usage(span, response)
+        answer = response.choices[0].message.content.strip()
+        answer_cache.put(variable, query, metadata, MODEL, answer)
+        return answer
 
     except Exception as e:
         print(f"Error generating response: {e}")
         return metadata
 
+def generate_natural_response_stream(variable, query, metadata):
+    """
+    Streaming version of generate_natural_response.
+    
+    Args:
+        variable (str): ADaM variable name
+        query (str): User's query about the variable
+        metadata (str): Metadata retrieved for the variable (see serialize_metadata_for_prompt)
+    
+    Yields:
+        str: Pieces of the explanation as the model produces them (the whole
+            answer at once when it is cached)
+    """
+    cached = answer_cache.get(variable, query, metadata, MODEL)
+    if cached:
+        yield cached
+        return
+
+    pieces = []
+    try:
+        # The span covers the request up to the first token only: it must not stay open
+        # across a yield, as the consumer may resume this generator on another thread or drop it
+        with tracer.span("llm.explain", model=MODEL, stream=True) as span:
+            started = time.perf_counter()
+            stream = client.chat.completions.create(
+                model=MODEL,
+                messages=_explanation_messages(variable, query, metadata),
+                stream=True
+            )
+            deltas = (chunk.choices[0].delta.content for chunk in stream
+                      if chunk.choices and chunk.choices[0].delta.content)
+            first = next(deltas, None)
+            span["first_token_ms"] = round((time.perf_counter() - started) * 1000, 1)
+        if first:
+            pieces.append(first)
+            yield first
+        for delta in deltas:
+            pieces.append(delta)
+            yield delta
+        answer_cache.put(variable, query, metadata, MODEL, "".join(pieces).strip())
+
+    except Exception as e:
+        print(f"Error generating response: {e}")
+        if not pieces:
+            yield metadata
+
 
 def main():
+    # --profile prints where the time went (API, CT parsing, LLM) when done
+    args = sys.argv[1:]
+    if "--profile" in args:
+        args.remove("--profile")
+        enable_profiling()
+
     # Check if query is provided
-    if len(sys.argv) < 2:
+    if not args:
         print("Please provide a natural language query about an ADaM variable.")
         sys.exit(1)
-    
+
     # Combine all arguments into a single query
-    query = " ".join(sys.argv[1:])
+    query = " ".join(args)
     
-    # Extract variable
-    variable = extract_adam_variable(query)
+    try:
+        retriever = ADaMMetadataRetriever()
+    except ValueError as e:
+        print(f"Error retrieving metadata: {e}")
+        sys.exit(1)
+
+    # Extract variable (locally when possible, otherwise with the LLM)
+    variable = resolve_adam_variable(query, retriever)
     
     if not variable:
         print("Could not extract a valid ADaM variable from your query.")
         sys.exit(1)
     
-    # Run adam_genius.py to get metadata
-    try:
-        result = subprocess.run(
-            ['python', 'adam_genius.py', variable], 
-            capture_output=True, 
-            text=True, 
-            check=True
-        )
-        metadata = result.stdout
-    except subprocess.CalledProcessError as e:
-        print(f"Error running adam_genius.py: {e}")
+    # Retrieve metadata in-process
+    details = get_variable_metadata(variable, retriever=retriever)
+    if not details:
+        print(f"Could not retrieve metadata for variable {variable}.")
         sys.exit(1)
+    metadata = serialize_metadata_for_prompt(details, query)
     
     # Generate conversational response
     conversational_response = generate_natural_response(variable, query, metadata)
@@ -1,15 +1,87 @@
 #!/usr/bin/env python3
 import argparse
+import hashlib
+import json
+import os
 import dotenv
-from llama_index.core import VectorStoreIndex, SimpleDirectoryReader
+from llama_index.core import VectorStoreIndex, SimpleDirectoryReader, StorageContext, load_index_from_storage
 
-def build_index(data_dir: str = "data") -> VectorStoreIndex:
+# Records which documents are in the persisted index and the content hash they were built from
+MANIFEST_FILE = "adamrag_manifest.json"
+
+def _positive_int(value: str) -> int:
+    """argparse type for counts that must be at least 1."""
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return number
+
+def _file_hash(path: str) -> str:
+    """SHA-256 of a file's contents."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _list_documents(data_dir: str) -> list:
+    """Files SimpleDirectoryReader would load from `data_dir` (non-recursive, hidden files skipped)."""
+    return sorted(
+        name for name in os.listdir(data_dir)
+        if not name.startswith(".") and os.path.isfile(os.path.join(data_dir, name))
+    )
+
+def _load_manifest(storage_dir: str) -> dict:
+    try:
+        with open(os.path.join(storage_dir, MANIFEST_FILE), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+def build_index(data_dir: str = "data", storage_dir: str = "storage", rebuild: bool = False) -> VectorStoreIndex:
     """
-    Load documents from `data_dir` and build an index.
+    Load the index persisted in `storage_dir`, re-indexing only documents in `data_dir`
+    that were added, changed or removed since it was built.
     """
     dotenv.load_dotenv()
-    documents = SimpleDirectoryReader(data_dir).load_data()
-    return VectorStoreIndex.from_documents(documents)
+    hashes = {name: _file_hash(os.path.join(data_dir, name)) for name in _list_documents(data_dir)}
+
+    manifest = {} if rebuild else _load_manifest(storage_dir)
+    index = None
+    if manifest:
+        try:
+            index = load_index_from_storage(StorageContext.from_defaults(persist_dir=storage_dir))
+        except (OSError, ValueError):
+            manifest = {} # Storage missing or unreadable; rebuild from scratch
+
+    changed = [name for name in hashes if manifest.get(name, {}).get("sha256") != hashes[name]]
+    removed = [name for name in manifest if name not in hashes]
+    if index is not None and not changed and not removed:
+        return index
+
+    # Drop the stale chunks of changed and removed documents
+    for name in removed + changed:
+        for doc_id in manifest.pop(name, {}).get("doc_ids", []):
+            index.delete_ref_doc(doc_id, delete_from_docstore=True)
+
+    # Parse and embed only the documents whose content changed
+    for name in changed:
+        print(f"Indexing {name}...")
+        documents = SimpleDirectoryReader(input_files=[os.path.join(data_dir, name)], filename_as_id=True).load_data()
+        if index is None:
+            index = VectorStoreIndex.from_documents(documents)
+        else:
+            for document in documents:
+                index.insert(document)
+        manifest[name] = {"sha256": hashes[name], "doc_ids": [document.doc_id for document in documents]}
+
+    if index is None:
+        index = VectorStoreIndex.from_documents([])
+
+    index.storage_context.persist(persist_dir=storage_dir)
+    with open(os.path.join(storage_dir, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return index
 
 def main():
     parser = argparse.ArgumentParser(
@@ -17,26 +89,103 @@ def main():
     )
     parser.add_argument(
         "query",
-        nargs="+",
+        nargs="*",
         help="The question you want to ask the index (wrap multi-word queries in quotes)"
     )
+    parser.add_argument(
+        "--queries-file",
+        help="Answer every question in this file (one per line) and write the answers as JSONL"
+    )
+    parser.add_argument(
+        "--output",
+        help="JSONL file for --queries-file answers (default: stdout)"
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["llamaindex", "auto", "embedding", "bm25"],
+        default="llamaindex",
+        help="llamaindex (default) uses LlamaIndex's remote embeddings and LLM; embedding (local CPU "
+             "sentence-transformers model), bm25 (lexical) or auto retrieve passages fully offline"
+    )
+    parser.add_argument(
+        "--model",
+        default=None,
+        help="sentence-transformers model for --backend embedding (default: all-MiniLM-L6-v2)"
+    )
+    parser.add_argument(
+        "--top-k",
+        type=_positive_int,
+        default=5,
+        help="Passages to retrieve per question with the local backends (default: 5)"
+    )
     parser.add_argument(
         "--data-dir",
         default="data",
         help="Path to the directory containing your documents (default: data)"
     )
+    parser.add_argument(
+        "--storage-dir",
+        default="storage",
+        help="Directory where the index is persisted between runs (default: storage)"
+    )
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="Ignore the persisted index and re-index every document"
+    )
     args = parser.parse_args()
 
-    # Join the list of words into a single query string
-    query_text = " ".join(args.query)
+    if args.queries_file:
+        with open(args.queries_file, encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+    elif args.query:
+        # Join the list of words into a single query string
+        queries = [" ".join(args.query)]
+    else:
+        parser.error("provide a query or --queries-file")
 
-    # Build the index and run the query
-    index = build_index(data_dir=args.data_dir)
-    query_engine = index.as_query_engine()
-    response = query_engine.query(query_text)
+    if args.backend == "llamaindex":
+        # Load (or incrementally update) the index and run the queries
+        index = build_index(data_dir=args.data_dir, storage_dir=args.storage_dir, rebuild=args.rebuild)
+        query_engine = index.as_query_engine()
+        answers = []
+        for query_text in queries:
+            response = query_engine.query(query_text)
+            answers.append({
+                "query": query_text,
+                "answer": str(response),
+                "passages": [
+                    {"source": node.metadata.get("file_name", ""), "score": node.score, "text": node.get_content()}
+                    for node in response.source_nodes
+                ]
+            })
+    else:
+        # Local retrieval: no network; all queries are embedded/scored in one batch
+        from adamrag_local import DEFAULT_EMBEDDING_MODEL, LocalIndex
+        index = LocalIndex.build(data_dir=args.data_dir, storage_dir=os.path.join(args.storage_dir, "local"),
+                                 backend=args.backend, model_name=args.model or DEFAULT_EMBEDDING_MODEL,
+                                 rebuild=args.rebuild)
+        answers = [
+            {"query": query_text, "answer": passages[0]["text"] if passages else "", "passages": passages}
+            for query_text, passages in zip(queries, index.search(queries, k=args.top_k))
+        ]
 
-    # Print out the response
-    print(response)
+    if args.queries_file:
+        lines = [json.dumps(answer) for answer in answers]
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+            print(f"Wrote {len(answers)} answers to {args.output}")
+        else:
+            print("\n".join(lines))
+    elif args.backend == "llamaindex":
+        # Print out the response
+        print(answers[0]["answer"])
+    else:
+        for rank, passage in enumerate(answers[0]["passages"], start=1):
+            print(f"[{rank}] {passage['source']} (score {passage['score']})")
+            print(passage["text"])
+            print()
 
 if __name__ == "__main__":
     main()
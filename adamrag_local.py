@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+import json
+import math
+import os
+import re
+from collections import Counter
+
+import numpy as np
+from llama_index.core import SimpleDirectoryReader
+
+from adamrag import _file_hash, _list_documents
+
+# Default CPU sentence-embedding model (downloaded once by sentence-transformers, then used offline)
+DEFAULT_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+def tokenize(text: str) -> list:
+    """Lower-cased alphanumeric tokens, used for chunking and BM25."""
+    return re.findall(r"[a-z0-9]+", text.lower())
+
+def chunk_text(text: str, chunk_words: int = 200, overlap_words: int = 40) -> list:
+    """Split text into overlapping windows of whitespace-delimited words."""
+    words = text.split()
+    if not words:
+        return []
+    step = max(1, chunk_words - overlap_words)
+    return [" ".join(words[start:start + chunk_words]) for start in range(0, max(1, len(words) - overlap_words), step)]
+
+def top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores in each row of a (queries x chunks) matrix, best first."""
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64)
+    candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    order = np.argsort(-np.take_along_axis(scores, candidates, axis=1), axis=1)
+    return np.take_along_axis(candidates, order, axis=1)
+
+class SentenceEmbedder:
+    """Local CPU sentence-embedding backend (requires the optional sentence-transformers package)."""
+
+    def __init__(self, model_name: str = DEFAULT_EMBEDDING_MODEL):
+        from sentence_transformers import SentenceTransformer
+        self.model_name = model_name
+        self.model = SentenceTransformer(model_name, device="cpu")
+
+    def embed(self, texts: list) -> np.ndarray:
+        """Embed texts in batches into L2-normalized float32 rows, so dot product is cosine similarity."""
+        return self.model.encode(texts, batch_size=64, convert_to_numpy=True,
+                                 normalize_embeddings=True).astype(np.float32)
+
+class BM25:
+    """Lexical BM25 scorer over the stored chunks; needs no model and no network."""
+
+    def __init__(self, texts: list, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        tokenized = [tokenize(text) for text in texts]
+        self.num_chunks = len(tokenized)
+        self.doc_len = np.array([len(tokens) for tokens in tokenized], dtype=np.float32)
+        avgdl = float(self.doc_len.mean()) if self.num_chunks else 1.0
+        self.norm = self.k1 * (1 - self.b + self.b * self.doc_len / (avgdl or 1.0))
+
+        # term -> (chunk ids, term frequencies), as arrays for vectorized scoring
+        postings = {}
+        for chunk_id, tokens in enumerate(tokenized):
+            for term, tf in Counter(tokens).items():
+                ids, tfs = postings.setdefault(term, ([], []))
+                ids.append(chunk_id)
+                tfs.append(tf)
+        self.postings = {}
+        for term, (ids, tfs) in postings.items():
+            idf = math.log(1 + (self.num_chunks - len(ids) + 0.5) / (len(ids) + 0.5))
+            self.postings[term] = (np.array(ids, dtype=np.int64), np.array(tfs, dtype=np.float32), idf)
+
+    def scores(self, queries: list) -> np.ndarray:
+        """BM25 scores of every chunk for each query, as a (queries x chunks) matrix."""
+        result = np.zeros((len(queries), self.num_chunks), dtype=np.float32)
+        for row, query in enumerate(queries):
+            for term in set(tokenize(query)):
+                if term in self.postings:
+                    ids, tfs, idf = self.postings[term]
+                    result[row, ids] += idf * tfs * (self.k1 + 1) / (tfs + self.norm[ids])
+        return result
+
+class LocalIndex:
+    """
+    Chunks of the documents in a data directory plus, for the embedding backend,
+    an on-disk embedding matrix that is memory-mapped at load time.
+
+    Files in `storage_dir`:
+        chunks.jsonl     one {"source", "text"} object per chunk
+        embeddings.npy   float32 (chunks x dim) matrix, embedding backend only
+        manifest.json    backend, model and per-document content hashes
+    """
+
+    def __init__(self, storage_dir: str, chunks: list, embeddings, manifest: dict, embedder=None):
+        self.storage_dir = storage_dir
+        self.chunks = chunks
+        self.embeddings = embeddings
+        self.manifest = manifest
+        self.backend = manifest["backend"]
+        self.embedder = embedder
+        self.bm25 = BM25([chunk["text"] for chunk in chunks]) if self.backend == "bm25" else None
+
+    @staticmethod
+    def resolve_backend(backend: str) -> str:
+        """Map "auto" to "embedding" when sentence-transformers is installed, otherwise "bm25"."""
+        if backend != "auto":
+            return backend
+        try:
+            import sentence_transformers # noqa: F401
+            return "embedding"
+        except ImportError:
+            return "bm25"
+
+    @classmethod
+    def build(cls, data_dir: str = "data", storage_dir: str = "storage/local", backend: str = "auto",
+              model_name: str = DEFAULT_EMBEDDING_MODEL, rebuild: bool = False) -> "LocalIndex":
+        """
+        Load the local index from `storage_dir`, re-chunking and re-embedding only documents
+        whose content hash changed (everything when the backend or model changed).
+        """
+        backend = cls.resolve_backend(backend)
+        os.makedirs(storage_dir, exist_ok=True)
+        manifest_path = os.path.join(storage_dir, "manifest.json")
+        chunks_path = os.path.join(storage_dir, "chunks.jsonl")
+        embeddings_path = os.path.join(storage_dir, "embeddings.npy")
+
+        try:
+            with open(manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+            with open(chunks_path, encoding="utf-8") as f:
+                chunks = [json.loads(line) for line in f]
+        except (OSError, json.JSONDecodeError):
+            manifest, chunks = {}, []
+
+        settings = {"backend": backend, "model": model_name if backend == "embedding" else None}
+        if rebuild or {key: manifest.get(key) for key in settings} != settings:
+            manifest, chunks = {}, []
+        documents = manifest.get("documents", {})
+
+        embedder = SentenceEmbedder(model_name) if backend == "embedding" else None
+        embeddings = None
+        if backend == "embedding" and chunks:
+            if os.path.exists(embeddings_path):
+                embeddings = np.load(embeddings_path, mmap_mode="r")
+            if embeddings is None or embeddings.shape[0] != len(chunks):
+                documents, chunks, embeddings = {}, [], None # Missing or out of sync; re-embed everything
+
+        hashes = {name: _file_hash(os.path.join(data_dir, name)) for name in _list_documents(data_dir)}
+        changed = [name for name in hashes if documents.get(name) != hashes[name]]
+        removed = [name for name in documents if name not in hashes]
+        if not changed and not removed:
+            return cls(storage_dir, chunks, embeddings, {**settings, "documents": documents}, embedder)
+
+        # Keep chunks (and their embedding rows) of unchanged documents
+        stale = set(changed) | set(removed)
+        keep = [i for i, chunk in enumerate(chunks) if chunk["source"] not in stale]
+        kept_chunks = [chunks[i] for i in keep]
+        kept_embeddings = np.asarray(embeddings[keep]) if embeddings is not None else None
+
+        new_chunks = []
+        for name in changed:
+            print(f"Indexing {name}...")
+            for document in SimpleDirectoryReader(input_files=[os.path.join(data_dir, name)]).load_data():
+                new_chunks.extend({"source": name, "text": text} for text in chunk_text(document.text))
+
+        chunks = kept_chunks + new_chunks
+        with open(chunks_path, "w", encoding="utf-8") as f:
+            for chunk in chunks:
+                f.write(json.dumps(chunk) + "\n")
+
+        if backend == "embedding":
+            new_embeddings = embedder.embed([chunk["text"] for chunk in new_chunks]) if new_chunks else None
+            parts = [part for part in (kept_embeddings, new_embeddings) if part is not None and len(part)]
+            matrix = np.concatenate(parts) if parts else np.zeros((0, 0), dtype=np.float32)
+            np.save(embeddings_path, matrix)
+            embeddings = np.load(embeddings_path, mmap_mode="r")
+
+        manifest = {**settings, "documents": hashes}
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=2)
+        return cls(storage_dir, chunks, embeddings, manifest, embedder)
+
+    def search(self, queries: list, k: int = 5) -> list:
+        """
+        Retrieve the top-k chunks for every query in one batch.
+
+        Returns one list per query of {"source", "score", "text"} dicts, best first.
+        """
+        if not self.chunks or not queries:
+            return [[] for _ in queries]
+        if self.backend == "embedding":
+            # One batched encode, then a single (queries x dim) @ (dim x chunks) product
+            scores = self.embedder.embed(queries) @ np.asarray(self.embeddings).T
+        else:
+            scores = self.bm25.scores(queries)
+
+        results = []
+        for row, indices in enumerate(top_k(scores, k)):
+            results.append([
+                {"source": self.chunks[i]["source"], "score": round(float(scores[row, i]), 4), "text": self.chunks[i]["text"]}
+                for i in indices
+            ])
+        return results
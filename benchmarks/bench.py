@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for ADaMMetadataRetriever against a local mock CDISC Library.
+
+Each workload runs in fresh processes so cold-start costs and peak memory are
+measured in isolation:
+
+    cold   empty response cache (first lookup on a new machine)
+    warm   new process, response cache and converted CT packages on disk
+    hot    second lookup on the same retriever (Streamlit/server steady state)
+
+Usage:
+    python benchmarks/bench.py                     # run and print a report
+    python benchmarks/bench.py --compare           # also compare with baseline.json; exit 1 on regressions
+    python benchmarks/bench.py --write-baseline    # record a new baseline.json
+    python benchmarks/bench.py --snapshot cdisc-snapshot.zip   # replay recorded payloads instead
+"""
+import argparse
+import io
+import json
+import math
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+import urllib.request
+from contextlib import redirect_stdout
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+from mock_library import ADAMIG_VERSION, COUNTERS_PATH, MockLibraryServer, snapshot_payloads, synthetic_payloads
+
+BASELINE_FILE = os.path.join(BENCHMARK_DIR, "baseline.json")
+MODES = ("cold", "warm", "hot")
+
+# Thresholds for --compare: slower p50 or larger peak RSS by these factors, or any extra HTTP call
+LATENCY_TOLERANCE = 1.5
+RSS_TOLERANCE = 1.5
+
+
+def workloads(payloads, adamig_version):
+    """Workload name -> ADaM variables to look up (one variable uses the single-lookup path)."""
+    ig = payloads[f"/mdr/adam/adamig-{adamig_version}"]
+    names = []
+    for ds in ig.get("dataStructures", []):
+        variable_lists = [ds.get("analysisVariables", [])] + [vs.get("analysisVariables", []) for vs in ds.get("analysisVariableSets", [])]
+        for variables in variable_lists:
+            for var in variables:
+                name = var.get("name", "").upper()
+                if name and name not in names:
+                    names.append(name)
+    return {
+        "single_variable": ["ABLFL"],
+        "multi_codelist": ["DTYPE", "PARAMCD"],
+        "batch_500": names[:500],
+    }
+
+
+def _counters(root_url):
+    with urllib.request.urlopen(root_url + COUNTERS_PATH) as response:
+        return json.load(response)
+
+
+def peak_rss_mb():
+    """Peak resident memory of this process in MB."""
+    # On Linux ru_maxrss survives exec, so a spawned child would report its parent's
+    # peak; VmHWM belongs to the new address space
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak_rss / (1024 * 1024) if sys.platform == "darwin" else peak_rss / 1024
+
+
+def _lookup(retriever, variables, adamig_version):
+    if len(variables) == 1:
+        return 1 if retriever.get_variable_details(variables[0], adamig_version) else 0
+    return len(retriever.get_variables_details(variables, adamig_version))
+
+
+def _measure(root_url, base_url, cache_dir, variables, adamig_version, mode):
+    """Run one workload in this (fresh) process and return its measurements."""
+    os.environ["CDISC_API_BASE_URL"] = base_url
+    os.environ.setdefault("CDISC_API_KEY", "benchmark")
+    from adam_genius import ADaMMetadataRetriever
+
+    with redirect_stdout(io.StringIO()): # The retriever's progress messages
+        if mode == "hot":
+            retriever = ADaMMetadataRetriever(cache_dir=cache_dir)
+            _lookup(retriever, variables, adamig_version)
+        before = _counters(root_url)
+        start = time.perf_counter()
+        if mode != "hot":
+            retriever = ADaMMetadataRetriever(cache_dir=cache_dir)
+        resolved = _lookup(retriever, variables, adamig_version)
+        seconds = time.perf_counter() - start
+        after = _counters(root_url)
+
+    return {
+        "seconds": seconds,
+        "resolved": resolved,
+        "peak_rss_mb": peak_rss_mb(),
+        **{key: after[key] - before[key] for key in after},
+    }
+
+
+def _in_new_process(*args):
+    context = multiprocessing.get_context("spawn")
+    with context.Pool(1) as pool:
+        return pool.apply(_measure, args)
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def run(server, payloads, adamig_version, repeats, selected=None):
+    """Run every workload in every mode and return the aggregated results, keyed "workload/mode"."""
+    results = {}
+    for name, variables in workloads(payloads, adamig_version).items():
+        if selected and name not in selected:
+            continue
+        for mode in MODES:
+            samples = []
+            for _ in range(repeats):
+                cache_dir = tempfile.mkdtemp(prefix="adam-bench-")
+                try:
+                    if mode == "warm":
+                        _in_new_process(server.root_url, server.base_url, cache_dir, variables, adamig_version, "cold")
+                    samples.append(_in_new_process(server.root_url, server.base_url, cache_dir, variables,
+                                                   adamig_version, mode))
+                finally:
+                    shutil.rmtree(cache_dir, ignore_errors=True)
+
+            seconds = [sample["seconds"] for sample in samples]
+            results[f"{name}/{mode}"] = {
+                "variables": len(variables),
+                "resolved": samples[-1]["resolved"],
+                "p50_ms": round(percentile(seconds, 0.50) * 1000, 1),
+                "p95_ms": round(percentile(seconds, 0.95) * 1000, 1),
+                "http_calls": max(sample["http_calls"] for sample in samples),
+                "not_modified": max(sample["not_modified"] for sample in samples),
+                "bytes_transferred": max(sample["bytes_transferred"] for sample in samples),
+                "peak_rss_mb": round(max(sample["peak_rss_mb"] for sample in samples), 1),
+            }
+            print(f"  {name}/{mode}: p50 {results[f'{name}/{mode}']['p50_ms']} ms", file=sys.stderr)
+    return results
+
+
+def format_report(results, baseline=None):
+    """Format results (and deltas against a baseline) as a plain-text table."""
+    header = "{:<26} {:>10} {:>10} {:>7} {:>12} {:>9}".format("Workload", "p50 ms", "p95 ms", "Calls", "Bytes", "RSS MB")
+    if baseline:
+        header += "  {:>10}".format("vs base")
+    lines = [header, "-" * len(header)]
+    for key, result in results.items():
+        line = "{:<26} {:>10} {:>10} {:>7} {:>12} {:>9}".format(key, result["p50_ms"], result["p95_ms"], result["http_calls"],
+                                                               result["bytes_transferred"], result["peak_rss_mb"])
+        if baseline and key in baseline:
+            base = baseline[key]
+            line += "  {:>9.2f}x".format(result["p50_ms"] / base["p50_ms"] if base["p50_ms"] else 1.0)
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def regressions(results, baseline):
+    """Describe every result that regressed against the baseline."""
+    found = []
+    for key, result in results.items():
+        base = baseline.get(key)
+        if not base:
+            continue
+        if result["http_calls"] > base["http_calls"]:
+            found.append(f"{key}: {result['http_calls']} HTTP calls (baseline {base['http_calls']})")
+        if base["p50_ms"] and result["p50_ms"] > base["p50_ms"] * LATENCY_TOLERANCE:
+            found.append(f"{key}: p50 {result['p50_ms']} ms (baseline {base['p50_ms']} ms)")
+        if base["peak_rss_mb"] and result["peak_rss_mb"] > base["peak_rss_mb"] * RSS_TOLERANCE:
+            found.append(f"{key}: peak RSS {result['peak_rss_mb']} MB (baseline {base['peak_rss_mb']} MB)")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ADaMMetadataRetriever against a local mock CDISC Library")
+    parser.add_argument("--latency", type=float, default=50, help="Milliseconds added to every mock response (default: 50)")
+    parser.add_argument("--repeats", type=int, default=5, help="Runs per workload and mode (default: 5)")
+    parser.add_argument("--workload", action="append", help="Only run this workload (repeatable)")
+    parser.add_argument("--snapshot", help="Serve payloads recorded in a snapshot archive instead of synthetic ones")
+    parser.add_argument("--adamig_version", default=ADAMIG_VERSION, help=f"ADaMIG version to look up (default: {ADAMIG_VERSION})")
+    parser.add_argument("--output", help="Also write the results as JSON to this file")
+    parser.add_argument("--compare", action="store_true", help="Compare with the baseline and exit 1 on regressions")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="Baseline file (default: benchmarks/baseline.json)")
+    parser.add_argument("--write-baseline", action="store_true", help="Save the results as the new baseline")
+    args = parser.parse_args()
+
+    payloads = snapshot_payloads(args.snapshot) if args.snapshot else synthetic_payloads()
+    with MockLibraryServer(payloads, latency=args.latency / 1000) as server:
+        results = run(server, payloads, args.adamig_version.replace(".", "-"), args.repeats, args.workload)
+
+    report = {
+        "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                        "latency_ms": args.latency, "repeats": args.repeats,
+                        "payloads": os.path.basename(args.snapshot) if args.snapshot else "synthetic"},
+        "results": results,
+    }
+    baseline = None
+    if args.compare:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+    print(format_report(results, baseline))
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.write_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print(f"\nBaseline saved to {args.baseline}")
+
+    if baseline:
+        found = regressions(results, baseline)
+        for message in found:
+            print(f"REGRESSION: {message}")
+        if found:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
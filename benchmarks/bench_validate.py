@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Throughput benchmark for DatasetValidator against a local mock CDISC Library.
+
+Generates BDS datasets (ADLB-like: STUDYID, USUBJID, PARAMCD, ABLFL, DTYPE, AVAL,
+AVISIT) with a sprinkling of invalid ABLFL values, then times `validate` on them
+with metadata served from the mock server's synthetic release. Metadata loading
+is warmed up first, so the timing covers reading and checking rows.
+
+Usage:
+    python benchmarks/bench_validate.py                          # two 2M-row Parquet files
+    python benchmarks/bench_validate.py --rows 500000 --format csv --files 1
+"""
+import argparse
+import io
+import os
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import redirect_stdout
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHMARK_DIR))
+
+import numpy as np
+import pandas as pd
+
+from mock_library import ADAMIG_VERSION, MockLibraryServer, synthetic_payloads
+
+
+def make_dataset(rows, seed=0):
+    """An ADLB-like BDS DataFrame with about one invalid ABLFL value per 10,000 rows."""
+    rng = np.random.default_rng(seed)
+    ablfl = rng.choice(np.array(["Y", "", ""], dtype=object), rows)
+    ablfl[rng.random(rows) < 0.0001] = "X"
+    return pd.DataFrame({
+        "STUDYID": "STUDY01",
+        "USUBJID": np.char.add("STUDY01-", (rng.integers(0, 5000, rows)).astype(str)).astype(object),
+        "PARAMCD": rng.choice(np.array([f"LB{i:03d}" for i in range(40)], dtype=object), rows),
+        "ABLFL": ablfl,
+        "DTYPE": rng.choice(np.array(["", "", "LOCF", "AVERAGE"], dtype=object), rows),
+        "AVAL": rng.normal(100, 15, rows),
+        "AVISIT": rng.choice(np.array(["BASELINE", "WEEK 4", "WEEK 8", "WEEK 12"], dtype=object), rows),
+    })
+
+
+def write_dataset(df, path):
+    if path.endswith(".parquet"):
+        df.to_parquet(path, index=False)
+    else:
+        df.to_csv(path, index=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark DatasetValidator throughput")
+    parser.add_argument("--rows", type=int, default=2000000, help="Rows per dataset (default: 2000000)")
+    parser.add_argument("--files", type=int, default=2, help="Number of datasets (default: 2)")
+    parser.add_argument("--format", choices=["parquet", "csv"], default="parquet", help="Dataset format (default: parquet)")
+    parser.add_argument("--chunksize", type=int, default=None, help="Rows per chunk (default: the validator's)")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="adam-bench-validate-")
+    try:
+        paths = []
+        for i in range(args.files):
+            path = os.path.join(work_dir, f"adlb{i + 1}.{args.format}")
+            write_dataset(make_dataset(args.rows, seed=i), path)
+            paths.append(path)
+
+        with MockLibraryServer(synthetic_payloads(), latency=0) as server:
+            os.environ["CDISC_API_BASE_URL"] = server.base_url
+            os.environ.setdefault("CDISC_API_KEY", "benchmark")
+            from adam_genius import ADaMMetadataRetriever
+            from adam_validate import DatasetValidator
+
+            with redirect_stdout(io.StringIO()): # The retriever's progress messages
+                retriever = ADaMMetadataRetriever(cache_dir=os.path.join(work_dir, "cache"), rate_limit=1000)
+                validator = DatasetValidator(retriever, ADAMIG_VERSION)
+                validator.structure_metadata("BDS") # Metadata and codelists, outside the timing
+
+                kwargs = {"chunksize": args.chunksize} if args.chunksize else {}
+                start = time.perf_counter()
+                issues = [issue for path in paths for issue in validator.validate(path, structure="BDS", **kwargs)]
+                seconds = time.perf_counter() - start
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    total_rows = args.rows * args.files
+    codelist_rows = sum(issue["Rows"] or 0 for issue in issues if issue["Check"] == "codelist")
+    print(f"Validated {args.files} x {args.rows} rows ({args.format}) in {seconds:.2f} s "
+          f"({total_rows / seconds:,.0f} rows/s); {len(issues)} issue(s), {codelist_rows} invalid codelist values")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+"""
+Local stand-in for the CDISC Library API, used by the benchmarks.
+
+Serves either payloads recorded in a snapshot archive (see `adam_genius.py snapshot`)
+or a deterministic synthetic ADaMIG/CT release of realistic size, with a configurable
+per-request latency. Every response is counted so a benchmark can report HTTP calls
+and bytes transferred.
+"""
+import gzip
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+API_PREFIX = "/api"
+COUNTERS_PATH = "/_counters" # Current counters as JSON, for benchmark processes
+ADAMIG_VERSION = "1-3"
+CT_VERSIONS = {"adamct": ["2024-03-29"], "sdtmct": ["2024-03-29", "2024-09-27"]}
+
+# Variables the workloads look up by name; the rest are generated
+NAMED_VARIABLES = {
+    "ADSL": [
+        ("STUDYID", "Study Identifier", "Char", "Req", []),
+        ("USUBJID", "Unique Subject Identifier", "Char", "Req", []),
+        ("AGE", "Age", "Num", "Req", []),
+        ("SEX", "Sex", "Char", "Req", [("sdtmct", "C66731")]),
+        ("TRTxxP", "Planned Treatment for Period xx", "Char", "Req", []),
+        ("SAFFL", "Safety Population Flag", "Char", "Cond", [("sdtmct", "C66742")]),
+    ],
+    "BDS": [
+        ("PARAMCD", "Parameter Code", "Char", "Req", [("sdtmct", "C65047"), ("sdtmct", "C67154")]),
+        ("ABLFL", "Baseline Record Flag", "Char", "Cond", [("sdtmct", "C66742")]),
+        ("DTYPE", "Derivation Type", "Char", "Perm", [("adamct", "C81223"), ("sdtmct", "C71620")]),
+        ("AVAL", "Analysis Value", "Num", "Cond", []),
+        ("AVISIT", "Analysis Visit", "Char", "Cond", []),
+    ],
+    "OCCDS": [
+        ("AESEV", "Severity/Intensity", "Char", "Perm", [("sdtmct", "C66769")]),
+        ("AOCCFL", "1st Occurrence within Subject Flag", "Char", "Perm", [("sdtmct", "C66742")]),
+    ],
+}
+GENERATED_VARIABLES = {"ADSL": 150, "BDS": 250, "OCCDS": 150}
+SDTMCT_CODELISTS = 1000 # Full SDTM CT has about a thousand codelists
+ADAMCT_CODELISTS = 30
+
+
+def _text(rng, words):
+    return " ".join(rng.choice(["analysis", "value", "subject", "record", "derived", "baseline", "visit",
+                                "parameter", "period", "flag", "date", "time", "treatment", "study"])
+                    for _ in range(words))
+
+
+def _codelist(rng, code, submission_value, name, extensible, terms):
+    return {
+        "conceptId": code, "submissionValue": submission_value, "name": name,
+        "extensible": extensible, "definition": _text(rng, 20),
+        "terms": [{"conceptId": f"{code}T{i}", "submissionValue": value, "preferredTerm": decoded,
+                   "definition": _text(rng, 15), "synonyms": [decoded.lower()]}
+                  for i, (value, decoded) in enumerate(terms)],
+    }
+
+
+def synthetic_payloads(seed=0):
+    """Generate API path -> JSON document for a synthetic ADaMIG release and CT packages."""
+    rng = random.Random(seed)
+    known = {
+        "C66742": ("NY", "No Yes Response", False, [("N", "No"), ("Y", "Yes"), ("U", "Unknown"), ("NA", "Not Applicable")]),
+        "C66731": ("SEX", "Sex", False, [("F", "Female"), ("M", "Male"), ("U", "Unknown")]),
+        "C66769": ("AESEV", "Severity/Intensity Scale", False, [("MILD", "Mild"), ("MODERATE", "Moderate"), ("SEVERE", "Severe")]),
+        "C65047": ("LBTESTCD", "Laboratory Test Code", True, [(f"LB{i:03d}", f"Lab Test {i}") for i in range(1500)]),
+        "C67154": ("LBTEST", "Laboratory Test Name", True, [(f"LB{i:03d}", f"Lab Test {i}") for i in range(1500)]),
+        "C71620": ("UNIT", "Unit", True, [(f"U{i:03d}", f"Unit {i}") for i in range(800)]),
+    }
+    sdtm_codes = list(known) + [f"C{100000 + i}" for i in range(SDTMCT_CODELISTS - len(known))]
+
+    payloads = {"/mdr/products/Terminology": {"_links": {"packages": [
+        {"href": f"/mdr/ct/packages/{standard}-{version}"}
+        for standard, versions in CT_VERSIONS.items() for version in versions
+    ]}}}
+
+    for standard, versions in CT_VERSIONS.items():
+        for version_number, version in enumerate(versions):
+            codelists = []
+            if standard == "sdtmct":
+                for code in sdtm_codes:
+                    if code in known:
+                        submission_value, name, extensible, terms = known[code]
+                    else:
+                        submission_value, name, extensible = f"CL{code[1:]}", f"Codelist {code}", bool(rng.random() < 0.8)
+                        terms = [(f"T{i}", f"Term {i}") for i in range(rng.randint(2, 60))]
+                    if version_number and code == "C66742":
+                        terms = terms + [("NR", "Not Reported")] # Later release adds a term
+                    codelists.append(_codelist(rng, code, submission_value, name, extensible, terms))
+            else:
+                codelists.append(_codelist(rng, "C81223", "DTYPE", "Derivation Type", True,
+                                           [("LOCF", "Last Observation Carried Forward"), ("AVERAGE", "Average"), ("WOCF", "Worst Observation Carried Forward")]))
+                for i in range(ADAMCT_CODELISTS - 1):
+                    codelists.append(_codelist(rng, f"C9{i:04d}", f"ADCL{i}", f"ADaM Codelist {i}", True,
+                                               [(f"V{j}", f"Value {j}") for j in range(rng.randint(2, 20))]))
+            payloads[f"/mdr/ct/packages/{standard}-{version}"] = {"name": f"{standard} {version}", "codelists": codelists}
+
+    data_structures = []
+    for ds_name, named in NAMED_VARIABLES.items():
+        variables = list(named) + [
+            (f"{ds_name[:2]}V{i:03d}", f"{ds_name} Generated Variable {i}", rng.choice(["Char", "Num"]),
+             rng.choice(["Req", "Cond", "Perm"]),
+             [("sdtmct", rng.choice(sdtm_codes))] if rng.random() < 0.3 else [])
+            for i in range(GENERATED_VARIABLES[ds_name])
+        ]
+        analysis_variables = []
+        for i, (name, label, datatype, core, codelists) in enumerate(variables):
+            detail_path = f"/mdr/adam/adamig-{ADAMIG_VERSION}/datastructures/{ds_name}/variables/{name}"
+            full = {
+                "name": name, "label": label, "description": _text(rng, 25), "simpleDatatype": datatype, "core": core,
+                "_links": {"self": {"href": detail_path},
+                           **({"codelist": [{"href": f"/mdr/root/ct/{standard}/codelists/{code}"} for standard, code in codelists]}
+                              if codelists else {})},
+            }
+            # Every tenth generated entry lacks the detail fields, exercising the per-variable endpoint
+            if i >= len(named) and i % 10 == 0:
+                analysis_variables.append({"name": name, "label": label})
+                payloads[detail_path] = full
+            else:
+                analysis_variables.append(full)
+        data_structures.append({"name": ds_name, "analysisVariableSets": [{"name": "Variables", "analysisVariables": analysis_variables}]})
+    payloads[f"/mdr/adam/adamig-{ADAMIG_VERSION}"] = {"name": f"ADaMIG v{ADAMIG_VERSION}", "dataStructures": data_structures}
+    return payloads
+
+
+def snapshot_payloads(path):
+    """Load API path -> JSON document from a snapshot archive of recorded responses."""
+    from adam_snapshot import Snapshot # The benchmark runner puts the repository on sys.path
+
+    snapshot = Snapshot(path)
+    try:
+        return {api_path: json.loads(snapshot.get(api_path)) for api_path in snapshot.manifest["paths"]}
+    finally:
+        snapshot.close()
+
+
+class MockLibraryServer:
+    """Threaded HTTP server answering /api/... from a dict of payloads."""
+
+    def __init__(self, payloads, latency=0.05, host="127.0.0.1", port=0):
+        """latency is the delay in seconds added to every response."""
+        self.latency = latency
+        # Pre-encode bodies once; the real API gzips responses for clients that accept it
+        self._bodies = {}
+        for api_path, document in payloads.items():
+            body = json.dumps(document).encode("utf-8")
+            self._bodies[API_PREFIX + api_path] = (body, gzip.compress(body, 6), '"' + hashlib.sha1(body).hexdigest() + '"')
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.bytes_sent = 0
+        self.not_modified = 0
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def root_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def base_url(self):
+        """Value for CDISC_API_BASE_URL."""
+        return self.root_url + API_PREFIX
+
+    def counters(self):
+        with self._lock:
+            return {"http_calls": self.calls, "bytes_transferred": self.bytes_sent, "not_modified": self.not_modified}
+
+    def _record(self, sent, not_modified=False):
+        with self._lock:
+            self.calls += 1
+            self.bytes_sent += sent
+            self.not_modified += int(not_modified)
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1" # Keep-alive, like the real API
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path == COUNTERS_PATH:
+                    # Benchmark bookkeeping: not delayed and not counted
+                    body = json.dumps(server.counters()).encode("utf-8")
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+
+                time.sleep(server.latency)
+                entry = server._bodies.get(self.path.split("?")[0])
+                if entry is None:
+                    body = b'{"message": "Not Found"}'
+                    self.send_response(404)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    server._record(len(body))
+                    return
+
+                body, compressed, etag = entry
+                if self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    server._record(0, not_modified=True)
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("ETag", etag)
+                if "gzip" in self.headers.get("Accept-Encoding", ""):
+                    body = compressed
+                    self.send_header("Content-Encoding", "gzip")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                server._record(len(body))
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="mock-library", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
@@ -1,7 +1,7 @@
 import streamlit as st
 import os
 import sys
-import subprocess
+import threading
 from dotenv import load_dotenv
 
 # Add project directory to path
@@ -9,7 +9,9 @@ project_dir = os.path.dirname(os.path.abspath(__file__))
 sys.path.insert(0, project_dir)
 
 try:
-    from adamai import extract_adam_variable, generate_natural_response
+    from adamai import (generate_natural_response_stream, get_variable_metadata, resolve_adam_variable,
+                        serialize_metadata_for_prompt)
+    from adam_genius import ADaMMetadataRetriever, CTReleaseRefresher, format_variable_details
 except ImportError as e:
     st.error(f"Import Error: {e}")
     st.error("Please check your project setup and import paths.")
@@ -18,8 +20,34 @@ except ImportError as e:
 # Load environment variables
 load_dotenv()
 
+# ADaMIG versions loaded before the first query, and hours between checks for new CT releases (0 disables them)
+ADAMIG_VERSIONS = [v.strip() for v in os.getenv("ADAM_GENIUS_ADAMIG_VERSIONS", "1-3").split(",") if v.strip()]
+CT_REFRESH_HOURS = float(os.getenv("ADAM_GENIUS_CT_REFRESH_HOURS", "24"))
+
+@st.cache_resource(show_spinner="Loading ADaMIG and Controlled Terminology...")
+def get_retriever():
+    """
+    One long-lived retriever shared by every session, so its caches persist across queries.
+
+    It is warmed up on the first page load, before any query is served; run
+    `adam_genius.py warm-up` before starting the server so that load comes from the
+    on-disk cache. A background thread swaps in new CT releases as they are published.
+    """
+    retriever = ADaMMetadataRetriever()
+    if not retriever.warm_up(ADAMIG_VERSIONS):
+        print("Warning: Warm-up incomplete; missing metadata will be fetched on first use.")
+    # Clearing the resource cache drops the previous retriever but not its refresher thread
+    for thread in threading.enumerate():
+        if isinstance(thread, CTReleaseRefresher):
+            thread.stop()
+    if CT_REFRESH_HOURS > 0:
+        CTReleaseRefresher(retriever, CT_REFRESH_HOURS * 3600).start()
+    return retriever
+
 def main():
     st.title("ADaM Genius")
+    # Warm up on page load rather than on the first query
+    retriever = get_retriever()
     
     # Sidebar for instructions
     st.sidebar.header("How to Use")
@@ -35,34 +63,43 @@ def main():
     
     # Process Query Automatically on Enter
     if query:
-        # Extract variable
-        variable = extract_adam_variable(query)
+        # Extract variable (locally when possible, otherwise with the LLM)
+        variable = resolve_adam_variable(query, retriever)
         
         if variable:
             # Display extracted variable
             st.success(f"Extracted Variable: {variable}")
             
-            # Run adam_genius.py to get metadata
+            # Retrieve metadata in-process with the shared retriever
             try:
-                result = subprocess.run(
-                    ['python', 'adam_genius.py', variable], 
-                    capture_output=True, 
-                    text=True, 
-                    check=True
-                )
-                metadata = result.stdout
+                details = get_variable_metadata(variable, retriever=retriever, include_codelists=False)
+                if not details:
+                    st.error(f"Could not retrieve metadata for variable {variable}.")
+                    return
                 
-                # Display raw metadata
+                # Display the variable attributes right away...
                 st.subheader("Variable Metadata")
-                st.code(metadata)
+                st.code(format_variable_details(details, include_codelists=False))
                 
-                # Generate conversational explanation
-                explanation = generate_natural_response(variable, metadata)
+                # ...then each codelist as soon as it has loaded
+                if details["CodelistLinks"]:
+                    st.subheader("Associated Codelist(s)")
+                for cl in retriever.iter_codelists(details, ordered=False):
+                    details["Codelists"].append(cl)
+                    st.markdown(f"**{cl['Name']}** ({cl['ID']}) [{cl['CodelistCode']}], "
+                                f"{cl['Standard']} {cl['Version']}, extensible: {cl['ExtensibleYN']}")
+                    st.dataframe([{"TERM": term["TERM"], "Decoded Value": term["TermDecodedValue"]}
+                                  for term in cl["Terms"]], hide_index=True)
+                
+                # Back to reference order, so the prompt (and its answer-cache key) is the same every run
+                order = {cl_id: i for i, (cl_id, standard, href) in enumerate(retriever.codelist_references(details))}
+                details["Codelists"].sort(key=lambda cl: (order.get(cl["CodelistCode"], len(order)), cl["Standard"]))
+
+                # Stream the conversational explanation from a compact, token-budgeted view
+                metadata = serialize_metadata_for_prompt(details, query)
                 st.subheader("Explanation")
-                st.write(explanation)
+                st.write_stream(generate_natural_response_stream(variable, query, metadata))
             
-            except subprocess.CalledProcessError as e:
-                st.error(f"Error running adam_genius.py: {e}")
             except Exception as e:
                 st.error(f"Unexpected error: {e}")
         else: